@@ -0,0 +1,389 @@
+import abc
+import sys
+from collections import OrderedDict
+
+import lru
+
+# marks a missing key for Cache.get, since None may be cached
+_MISSING = object()
+
+
+class Cache(abc.ABC):
+    """
+    the interface shared by every eviction policy.  get raises KeyError on a miss unless it
+    is given a default, and set adds or replaces an element, evicting by the policy's rules.
+    lru.LRUCache and lru.ShardedLRUCache are registered as implementations
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: the number of elements to store in the cache, at least 1
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1, not %s' % capacity)
+        self.capacity = capacity
+
+    @abc.abstractmethod
+    def get(self, x, default=_MISSING):
+        pass
+
+    @abc.abstractmethod
+    def set(self, x, y):
+        pass
+
+    @abc.abstractmethod
+    def __len__(self):
+        pass
+
+    @staticmethod
+    def _miss(x, default):
+        if default is _MISSING:
+            raise KeyError(x)
+        return default
+
+
+Cache.register(lru.LRUCache)
+Cache.register(lru.ShardedLRUCache)
+
+
+class LFUCache(Cache):
+    """
+    a cache that evicts the least frequently accessed element, and the least recently
+    accessed of those on a tie
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: the number of elements to store in the cache
+        """
+        super().__init__(capacity)
+        self.__values = {}
+        self.__counts = {}
+
+        # keys by access count, each bucket in recency order, oldest first
+        self.__buckets = {}
+        self.__min_count = 0
+
+    def __len__(self):
+        return len(self.__values)
+
+    def __touch(self, x):
+        # move x up to the next bucket
+        count = self.__counts[x]
+        bucket = self.__buckets[count]
+        del bucket[x]
+        if not bucket:
+            del self.__buckets[count]
+            if self.__min_count == count:
+                self.__min_count = count + 1
+
+        self.__counts[x] = count + 1
+        self.__buckets.setdefault(count + 1, OrderedDict())[x] = None
+
+    def get(self, x, default=_MISSING):
+        if x not in self.__values:
+            return self._miss(x, default)
+        self.__touch(x)
+        return self.__values[x]
+
+    def set(self, x, y):
+        if x in self.__values:
+            self.__values[x] = y
+            self.__touch(x)
+            return
+
+        if len(self.__values) >= self.capacity:
+            bucket = self.__buckets[self.__min_count]
+            victim, _ = bucket.popitem(last=False)
+            if not bucket:
+                del self.__buckets[self.__min_count]
+            del self.__values[victim]
+            del self.__counts[victim]
+
+        self.__values[x] = y
+        self.__counts[x] = 1
+        self.__buckets.setdefault(1, OrderedDict())[x] = None
+        self.__min_count = 1
+
+
+class TwoQueueCache(Cache):
+    """
+    the full 2Q policy.  new elements enter a FIFO queue, and only elements requested again
+    after falling out of it are promoted to the main LRU queue, so a single sequential
+    scan cannot flush the elements that are used repeatedly
+    """
+
+    def __init__(self, capacity, in_ratio=0.25, out_ratio=0.5):
+        """
+        :param capacity: the number of elements to store in the cache
+        :param in_ratio: the share of capacity for the FIFO queue of new elements
+        :param out_ratio: how many keys recently dropped from the FIFO queue to remember,
+                          as a share of capacity
+        """
+        super().__init__(capacity)
+        self.in_size = max(1, int(capacity * in_ratio))
+        self.out_size = max(1, int(capacity * out_ratio))
+        self.__in = OrderedDict()
+        self.__out = OrderedDict()
+        self.__main = OrderedDict()
+
+    def __len__(self):
+        return len(self.__in) + len(self.__main)
+
+    def __reclaim(self):
+        if len(self) < self.capacity:
+            return
+
+        # prefer to drop from the FIFO queue, remembering the key in case it returns
+        if len(self.__in) > self.in_size or not self.__main:
+            victim, _ = self.__in.popitem(last=False)
+            self.__out[victim] = None
+            if len(self.__out) > self.out_size:
+                self.__out.popitem(last=False)
+        else:
+            self.__main.popitem(last=False)
+
+    def get(self, x, default=_MISSING):
+        if x in self.__main:
+            self.__main.move_to_end(x)
+            return self.__main[x]
+
+        # elements in the FIFO queue keep their place when accessed
+        if x in self.__in:
+            return self.__in[x]
+        return self._miss(x, default)
+
+    def set(self, x, y):
+        if x in self.__main:
+            self.__main[x] = y
+            self.__main.move_to_end(x)
+        elif x in self.__in:
+            self.__in[x] = y
+        elif x in self.__out:
+            del self.__out[x]
+            self.__reclaim()
+            self.__main[x] = y
+        else:
+            self.__reclaim()
+            self.__in[x] = y
+
+
+class ARCCache(Cache):
+    """
+    adaptive replacement cache.  elements seen once (t1) and more than once (t2) are kept
+    in separate LRU lists, and the keys recently evicted from each (b1 and b2) steer how
+    much of the capacity goes to each list
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: the number of elements to store in the cache
+        """
+        super().__init__(capacity)
+
+        # the target size of t1
+        self.p = 0
+        self.__t1 = OrderedDict()
+        self.__t2 = OrderedDict()
+        self.__b1 = OrderedDict()
+        self.__b2 = OrderedDict()
+
+    def __len__(self):
+        return len(self.__t1) + len(self.__t2)
+
+    def __replace(self, x):
+        # make room when the cache is full, evicting from t1 while it is over its target
+        if len(self) < self.capacity:
+            return
+        if self.__t1 and (len(self.__t1) > self.p or (x in self.__b2 and len(self.__t1) == self.p)):
+            victim, _ = self.__t1.popitem(last=False)
+            self.__b1[victim] = None
+        else:
+            victim, _ = self.__t2.popitem(last=False)
+            self.__b2[victim] = None
+
+    def get(self, x, default=_MISSING):
+        if x in self.__t1:
+            self.__t2[x] = self.__t1.pop(x)
+        elif x in self.__t2:
+            self.__t2.move_to_end(x)
+        else:
+            return self._miss(x, default)
+        return self.__t2[x]
+
+    def set(self, x, y):
+        if x in self.__t1 or x in self.__t2:
+            self.__t1.pop(x, None)
+            self.__t2.pop(x, None)
+            self.__t2[x] = y
+            return
+
+        # a recently evicted key returning means its list deserves more room
+        if x in self.__b1:
+            self.p = min(self.capacity, self.p + max(len(self.__b2) // len(self.__b1), 1))
+            self.__replace(x)
+            del self.__b1[x]
+            self.__t2[x] = y
+            return
+        if x in self.__b2:
+            self.p = max(0, self.p - max(len(self.__b1) // len(self.__b2), 1))
+            self.__replace(x)
+            del self.__b2[x]
+            self.__t2[x] = y
+            return
+
+        # a new key: keep t1 and b1 together within capacity, and everything within twice it
+        if len(self.__t1) + len(self.__b1) >= self.capacity:
+            if len(self.__t1) < self.capacity:
+                self.__b1.popitem(last=False)
+                self.__replace(x)
+            else:
+                self.__t1.popitem(last=False)
+        else:
+            if len(self) + len(self.__b1) + len(self.__b2) >= 2 * self.capacity:
+                self.__b2.popitem(last=False)
+            self.__replace(x)
+        self.__t1[x] = y
+
+
+class _FrequencySketch:
+    """
+    a count-min sketch of 4-bit saturating counters.  every counter is halved once the
+    sketch has counted sample_size accesses, so popularity fades over time
+    """
+
+    def __init__(self, width, depth=4):
+        # a power of two width lets a mask replace the modulo
+        self.width = 1 << max(1, width - 1).bit_length()
+        self.depth = depth
+        self.table = bytearray(self.width * depth)
+        self.sample_size = 10 * self.width
+        self.additions = 0
+
+    def __indexes(self, x):
+        h = hash(x)
+        mask = self.width - 1
+        return [row * self.width + (hash((h, row)) & mask) for row in range(self.depth)]
+
+    def increment(self, x):
+        for i in self.__indexes(x):
+            if self.table[i] < 15:
+                self.table[i] += 1
+
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.table = bytearray(count >> 1 for count in self.table)
+            self.additions //= 2
+
+    def estimate(self, x):
+        return min(self.table[i] for i in self.__indexes(x))
+
+
+class TinyLFUCache(Cache):
+    """
+    W-TinyLFU.  new elements enter a small LRU window.  an element pushed out of the window
+    only displaces the main cache's next victim if a frequency sketch estimates it has been
+    accessed more often, which keeps one-off scans out of the main cache.  the main cache is
+    a segmented LRU: elements hit while on probation move to a protected segment
+    """
+
+    def __init__(self, capacity, window_ratio=0.01, protected_ratio=0.8):
+        """
+        :param capacity: the number of elements to store in the cache
+        :param window_ratio: the share of capacity for the admission window
+        :param protected_ratio: the share of the main cache for the protected segment
+        """
+        super().__init__(capacity)
+        self.window_size = max(1, int(capacity * window_ratio))
+        self.main_size = capacity - self.window_size
+        self.protected_size = int(self.main_size * protected_ratio)
+        self.__window = OrderedDict()
+        self.__probation = OrderedDict()
+        self.__protected = OrderedDict()
+        self.__sketch = _FrequencySketch(capacity)
+
+    def __len__(self):
+        return len(self.__window) + len(self.__probation) + len(self.__protected)
+
+    def get(self, x, default=_MISSING):
+        if x in self.__window:
+            self.__window.move_to_end(x)
+            value = self.__window[x]
+        elif x in self.__protected:
+            self.__protected.move_to_end(x)
+            value = self.__protected[x]
+        elif x in self.__probation:
+            # promote, demoting the protected segment's oldest if it is full
+            value = self.__protected[x] = self.__probation.pop(x)
+            if len(self.__protected) > self.protected_size:
+                demoted, demoted_value = self.__protected.popitem(last=False)
+                self.__probation[demoted] = demoted_value
+        else:
+            return self._miss(x, default)
+
+        self.__sketch.increment(x)
+        return value
+
+    def set(self, x, y):
+        for segment in (self.__window, self.__probation, self.__protected):
+            if x in segment:
+                segment[x] = y
+                self.get(x)
+                return
+
+        self.__sketch.increment(x)
+        self.__window[x] = y
+        if len(self.__window) <= self.window_size:
+            return
+
+        # the window's oldest element is a candidate for the main cache
+        candidate, value = self.__window.popitem(last=False)
+        if len(self.__probation) + len(self.__protected) < self.main_size:
+            self.__probation[candidate] = value
+            return
+
+        # admit the candidate only if it is more popular than the element it would evict
+        victims = self.__probation or self.__protected
+        if not victims:
+            return
+        victim = next(iter(victims))
+        if self.__sketch.estimate(candidate) > self.__sketch.estimate(victim):
+            del victims[victim]
+            self.__probation[candidate] = value
+
+
+def replay(trace, policies):
+    """
+    replay a recorded trace of keys through several caches at once, filling each miss
+    with set, and report how often each cache hit
+    :param trace: an iterable of keys, in the order they were requested
+    :param policies: a dict of name -> Cache
+    :return: a dict of name -> hit ratio
+    """
+    miss = object()
+    hits = dict.fromkeys(policies, 0)
+    requests = 0
+    for key in trace:
+        requests += 1
+        for name, cache in policies.items():
+            if cache.get(key, miss) is miss:
+                cache.set(key, key)
+            else:
+                hits[name] += 1
+
+    return {name: hits[name] / requests if requests else 0.0 for name in policies}
+
+
+if __name__ == '__main__':
+    # usage: python caches.py TRACE_FILE CAPACITY, with one key per line of TRACE_FILE
+    capacity = int(sys.argv[2])
+    with open(sys.argv[1]) as trace:
+        ratios = replay((line.rstrip('\n') for line in trace), {
+            'lru': lru.LRUCache(capacity),
+            'lfu': LFUCache(capacity),
+            '2q': TwoQueueCache(capacity),
+            'arc': ARCCache(capacity),
+            'w-tinylfu': TinyLFUCache(capacity),
+        })
+    for name, ratio in ratios.items():
+        print('%-10s %.4f' % (name, ratio))
@@ -0,0 +1,77 @@
+import random
+import unittest
+import caches
+import lru
+
+
+def _policies(capacity):
+    return {
+        'lfu': caches.LFUCache(capacity),
+        '2q': caches.TwoQueueCache(capacity),
+        'arc': caches.ARCCache(capacity),
+        'w-tinylfu': caches.TinyLFUCache(capacity),
+    }
+
+
+class TestCaches(unittest.TestCase):
+    def test_cache_interface(self):
+        self.assertIsInstance(lru.LRUCache(4), caches.Cache)
+        self.assertIsInstance(lru.ShardedLRUCache(4), caches.Cache)
+        for name, cache in _policies(4).items():
+            self.assertIsInstance(cache, caches.Cache)
+            cache.set('a', 'A')
+            cache.set('a', 'AA')
+            self.assertEqual(cache.get('a'), 'AA', name)
+            self.assertRaises(KeyError, cache.get, 'b')
+            self.assertEqual(cache.get('b', None), None)
+
+    def test_cache_capacity(self):
+        rng = random.Random(1)
+        for name, cache in _policies(50).items():
+            for _ in range(5000):
+                key = rng.randrange(200)
+                if cache.get(key, None) is None:
+                    cache.set(key, key)
+                self.assertLessEqual(len(cache), 50, name)
+                self.assertEqual(cache.get(key, key), key)
+
+    def test_lfu(self):
+        cache = caches.LFUCache(2)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.get('a')
+        cache.set('c', 'C')
+        self.assertRaises(KeyError, cache.get, 'b')
+        self.assertEqual(cache.get('a'), 'A')
+
+    def test_replay_scan_resistance(self):
+        # warm up a hot set of 50 keys, then keep using it during a one-off scan that
+        # touches more than the cache can hold between uses of each hot key
+        trace = ['hot%d' % (i % 50) for i in range(250)]
+        for scanned in range(5000):
+            trace.append('hot%d' % (scanned % 50))
+            trace.extend('scan%d-%d' % (scanned, i) for i in range(3))
+
+        # 2Q needs to remember enough evicted keys to see the hot set come back
+        policies = _policies(100)
+        policies['2q'] = caches.TwoQueueCache(100, out_ratio=2)
+        policies['lru'] = lru.LRUCache(100)
+        ratios = caches.replay(trace, policies)
+        self.assertLess(ratios['lru'], 0.05)
+        for name in ('lfu', '2q', 'arc', 'w-tinylfu'):
+            self.assertGreater(ratios[name], 0.2, name)
+
+    def test_capacity(self):
+        for policy in (lru.LRUCache, lru.ShardedLRUCache,
+                       caches.LFUCache, caches.TwoQueueCache, caches.ARCCache, caches.TinyLFUCache):
+            self.assertRaises(ValueError, policy, 0)
+
+            # a single slot still behaves like a cache
+            cache = policy(1)
+            for key in 'abcab':
+                cache.set(key, key.upper())
+                self.assertLessEqual(len(cache), 1, policy.__name__)
+
+
+if __name__ == '__main__':
+    unittest.main()
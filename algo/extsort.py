@@ -0,0 +1,148 @@
+import gzip
+import heapq
+import io
+import os
+import shutil
+import sys
+import tempfile
+
+import quicksort
+
+# the estimated cost of holding one record in a list, on top of its payload
+_RECORD_OVERHEAD = sys.getsizeof(b'') + 8
+
+
+def iter_records(f, record_size):
+    """
+    read fixed width records from a binary file until it ends
+    :param f: a file object opened for binary reading
+    :param record_size: the length of each record in bytes
+    :return: a generator of bytes
+    """
+    while True:
+        record = f.read(record_size)
+        if len(record) < record_size:
+            if record:
+                raise ValueError('the input ends with a partial record of %d bytes' % len(record))
+            return
+        yield record
+
+
+def _chunks(records, record_size, memory):
+    # group records into lists that should fit in memory alongside their sorted copy,
+    # yielding (chunk, last) so the caller knows when the input has ended
+    count = max(1, memory // (2 * (record_size + _RECORD_OVERHEAD)))
+    records = iter(records)
+    record = next(records, None)
+    while record is not None:
+        chunk = []
+        while record is not None and len(chunk) < count:
+            if len(record) != record_size:
+                raise ValueError('expected a %d byte record, not %d bytes' % (record_size, len(record)))
+            chunk.append(record)
+            record = next(records, None)
+        yield chunk, record is None
+
+
+def _write_run(records, directory, compress, buffer_size):
+    fd, path = tempfile.mkstemp(suffix='.run', dir=directory)
+    with open(fd, 'wb', buffering=buffer_size) as f:
+        # favour speed over ratio, since every run is read back exactly once
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=1) if compress else f as out:
+            for record in records:
+                out.write(record)
+    return path
+
+
+def _read_run(path, record_size, compress, buffer_size):
+    with open(path, 'rb', buffering=buffer_size) as f:
+        if compress:
+            f = gzip.GzipFile(fileobj=f, mode='rb')
+        yield from iter_records(f, record_size)
+
+
+def _merge(runs, record_size, key, reverse, compress, buffer_size):
+    return heapq.merge(*(_read_run(path, record_size, compress, buffer_size) for path in runs),
+                       key=key, reverse=reverse)
+
+
+def external_sort(source, record_size, key=None, reverse=False, memory=64 << 20, compress=False,
+                  fan_in=64, tmpdir=None):
+    """
+    sort fixed width records that may not fit in memory.  the input is read in chunks of
+    about memory bytes, each chunk is sorted with quicksort and spilled to a temporary run
+    file, and the runs are combined with a k-way heap merge, in several passes if there are
+    more than fan_in of them.  input that fits in one chunk is never written out
+    :param source: a path, a binary file object, or an iterable of bytes records
+    :param record_size: the length of each record in bytes
+    :param key: a function of one record returning the value to sort by
+    :param reverse: sort in descending order
+    :param memory: roughly how many bytes of records to hold at once
+    :param compress: gzip the run files
+    :param fan_in: the most runs to merge at once
+    :param tmpdir: the directory for run files, by default the system temporary directory
+    :return: a generator of the sorted records.  run files are removed once it is exhausted
+             or closed
+    """
+    if fan_in < 2:
+        raise ValueError('fan_in must be at least 2, not %d' % fan_in)
+
+    if isinstance(source, (str, bytes, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield from external_sort(f, record_size, key, reverse, memory, compress, fan_in, tmpdir)
+        return
+    if hasattr(source, 'read'):
+        source = iter_records(source, record_size)
+
+    directory = tempfile.mkdtemp(prefix='extsort-', dir=tmpdir)
+    try:
+        # each open run gets an equal share of the memory as its read buffer.  a buffer of
+        # 1 would ask for line buffering, which binary files don't support
+        buffer_size = max(record_size, io.DEFAULT_BUFFER_SIZE, memory // (fan_in + 1))
+
+        runs = []
+        for chunk, last in _chunks(source, record_size, memory):
+            chunk = quicksort.quicksort(chunk, key=key, reverse=reverse)
+            if last and not runs:
+                yield from chunk
+                return
+            runs.append(_write_run(chunk, directory, compress, buffer_size))
+
+        # merge neighbouring runs in passes until few enough remain.  heapq.merge prefers
+        # earlier runs on ties, so keeping the runs in input order keeps the sort stable
+        while len(runs) > fan_in:
+            merged = []
+            for i in range(0, len(runs), fan_in):
+                group = runs[i:i + fan_in]
+                merged.append(_write_run(_merge(group, record_size, key, reverse, compress, buffer_size),
+                                         directory, compress, buffer_size))
+                for path in group:
+                    os.remove(path)
+            runs = merged
+
+        yield from _merge(runs, record_size, key, reverse, compress, buffer_size)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def sort_file(src, dst, record_size, **kwargs):
+    """
+    externally sort the fixed width records of one file into another
+    :param src: the path to read
+    :param dst: the path to write
+    :param record_size: the length of each record in bytes
+    :param kwargs: passed to external_sort
+    :return: the number of records written
+    """
+    count = 0
+    with open(dst, 'wb', buffering=1 << 20) as out:
+        for record in external_sort(src, record_size, **kwargs):
+            out.write(record)
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    # usage: python extsort.py SRC DST RECORD_SIZE [MEMORY_BYTES]
+    memory = int(sys.argv[4]) if len(sys.argv) > 4 else 64 << 20
+    print(sort_file(sys.argv[1], sys.argv[2], int(sys.argv[3]), memory=memory))
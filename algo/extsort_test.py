@@ -0,0 +1,64 @@
+import os
+import random
+import tempfile
+import unittest
+import warnings
+
+import extsort
+
+
+class TestExtsort(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.records = [bytes(rng.randrange(4) for _ in range(8)) for _ in range(3000)]
+
+    def test_external_sort(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for compress in (False, True):
+                # about 16 runs with at most 3 merged at once, so it takes several passes
+                result = list(extsort.external_sort(self.records, 8, memory=20000, compress=compress,
+                                                    fan_in=3, tmpdir=tmpdir))
+                self.assertEqual(result, sorted(self.records))
+                self.assertEqual(os.listdir(tmpdir), [])
+
+        # input that fits in memory is sorted without run files
+        self.assertEqual(list(extsort.external_sort(self.records, 8)), sorted(self.records))
+        self.assertEqual(list(extsort.external_sort([], 8)), [])
+
+    def test_small_records(self):
+        records = [bytes([value]) for value in random.Random(2).choices(range(256), k=500)]
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            result = list(extsort.external_sort(records, 1, memory=64))
+        self.assertEqual(result, sorted(records))
+
+    def test_key_reverse(self):
+        field = lambda record: record[:2]
+        for reverse in (False, True):
+            result = list(extsort.external_sort(self.records, 8, key=field, reverse=reverse,
+                                                memory=20000, fan_in=2))
+            self.assertEqual(result, sorted(self.records, key=field, reverse=reverse))
+
+    def test_sort_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = os.path.join(tmpdir, 'src')
+            dst = os.path.join(tmpdir, 'dst')
+            with open(src, 'wb') as f:
+                f.write(b''.join(self.records))
+
+            self.assertEqual(extsort.sort_file(src, dst, 8, memory=20000, compress=True), 3000)
+            with open(dst, 'rb') as f:
+                self.assertEqual(f.read(), b''.join(sorted(self.records)))
+
+            with open(src, 'ab') as f:
+                f.write(b'abc')
+            with self.assertRaises(ValueError):
+                extsort.sort_file(src, dst, 8)
+
+        with self.assertRaises(ValueError):
+            list(extsort.external_sort([b'short'], 8))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,100 +1,1086 @@
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from heapq import heappop, heappush
+from itertools import repeat
+from multiprocessing import shared_memory
+
+
+# header of the binary csr format: magic, vertex count, edge count, and whether edges are
+# weighted.  it is followed by the little endian int64 offsets and int32 targets, then for
+# weighted graphs, padding to a multiple of 8 bytes and the float64 weights
+_CSR_MAGIC = b'ALGOCSR2'
+_CSR_HEADER = struct.Struct('<8sqqq')
+
+# the first version of the format, which load still reads: no weighted flag, and no weights
+_CSR1_MAGIC = b'ALGOCSR1'
+_CSR1_HEADER = struct.Struct('<8sqq')
+
+
+class FrozenGraphError(Exception):
+    pass
+
+
 class Vertex:
-    def __init__(self, content=None, edges=None):
+    # edge weights, parallel to edges.  unweighted vertices never set this,
+    # so they share the class attribute instead of holding their own
+    weights = None
+
+    def __init__(self, content=None, edges=None, weights=None):
+        _check_weights(edges, weights)
         self.content = content
         if edges is None:
             self.edges = []
         else:
             self.edges = edges
+        if weights is not None:
+            self.weights = weights
+
+
+def _check_weights(edges, weights):
+    # weights are parallel to edges, and a mismatch would silently drop or shift edges
+    if weights is not None and (edges is None or len(edges) != len(weights)):
+        raise ValueError('expected a weight per edge, not %d weights for %d edges'
+                         % (len(weights), 0 if edges is None else len(edges)))
+
+
+def _index_contents(contents):
+    # map each content to the set of vertices holding it
+    index = {}
+    for head, content in enumerate(contents):
+        index.setdefault(content, set()).add(head)
+    return index
+
+
+def _count_offsets(vertices, n):
+    # offsets[v + 1] - offsets[v] is the number of times v appears in vertices
+    offsets = array('q', bytes(8 * (n + 1)))
+    for v in vertices:
+        offsets[v + 1] += 1
+    for head in range(n):
+        offsets[head + 1] += offsets[head]
+    return offsets
+
+
+def _expand_frontier(offsets, targets, start, visited, frontier):
+    # collect the unvisited neighbors of frontier, whose vertices are numbered from start
+    # within offsets.  visited is a bitmap and is only read here
+    found = set()
+    for head in frontier:
+        head -= start
+        for neighbor in targets[offsets[head]:offsets[head + 1]]:
+            if not visited[neighbor >> 3] & (1 << (neighbor & 7)):
+                found.add(neighbor)
+    return array('i', found)
+
+
+def _expand_shard(shard_name, start, vertex_count, edge_count, visited_name, frontier):
+    # runs in a worker process: attach to one adjacency shard and the shared visited
+    # bitmap, and expand the part of the frontier that the shard owns
+    shard = shared_memory.SharedMemory(shard_name)
+    visited = shared_memory.SharedMemory(visited_name)
+    split = 8 * (vertex_count + 1)
+    try:
+        with shard.buf[:split] as raw_offsets, raw_offsets.cast('q') as offsets, \
+                shard.buf[split:split + 4 * edge_count] as raw_targets, raw_targets.cast('i') as targets:
+            return _expand_frontier(offsets, targets, start, visited.buf, frontier)
+    finally:
+        shard.close()
+        visited.close()
+
+
+def _strong_components(g):
+    # an iterative tarjan.  components are numbered in the order they complete, so every
+    # edge between two components points from the higher label to the lower one.  edges to
+    # vertices that do not exist yet are skipped
+    n = len(g)
+    order = array('i', [-1]) * n
+    low = array('i', [0]) * n
+    labels = array('i', [-1]) * n
+    on_stack = bytearray(n)
+    stack = []
+    counter = 0
+    count = 0
+
+    for root in range(n):
+        if order[root] >= 0:
+            continue
+
+        order[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = 1
+
+        # each entry is a vertex on the search path and an iterator over its remaining neighbors
+        path = [(root, iter(g._neighbors(root)))]
+        while path:
+            head, neighbors = path[-1]
+            for neighbor in neighbors:
+                if neighbor >= n:
+                    continue
+                if order[neighbor] < 0:
+                    order[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack[neighbor] = 1
+                    path.append((neighbor, iter(g._neighbors(neighbor))))
+                    break
+                elif on_stack[neighbor] and order[neighbor] < low[head]:
+                    low[head] = order[neighbor]
+            else:
+                # every neighbor is done, so pass our low link up to the caller
+                path.pop()
+                if path and low[head] < low[path[-1][0]]:
+                    low[path[-1][0]] = low[head]
+
+                # head is the root of a component, which is everything above it on the stack
+                if low[head] == order[head]:
+                    while True:
+                        v = stack.pop()
+                        on_stack[v] = 0
+                        labels[v] = count
+                        if v == head:
+                            break
+                    count += 1
+
+    return labels, count
 
 
 class Graph:
-    def __init__(self):
+    def __init__(self, index_content=False):
+        """
+        :param index_content: keep a content -> vertices index so searches for missing
+                              content return without traversing.  content must be hashable
+        """
         self.graph = []
+        self._index = {} if index_content else None
 
-    def add_edge(self, x, y):
-        self.graph[x].edges.append(y)
+        # reverse adjacency, built on demand and dropped whenever edges change
+        self._reverse = None
+
+        # see index_reachability
+        self._reachability = None
+
+    def __len__(self):
+        return len(self.graph)
+
+    def _content(self, v):
+        return self.graph[v].content
+
+    def _neighbors(self, v):
+        return self.graph[v].edges
+
+    def _weighted_neighbors(self, v):
+        # edges added without a weight cost 1
+        weights = self.graph[v].weights
+        return zip(self.graph[v].edges, repeat(1) if weights is None else weights)
+
+    def _reverse_neighbors(self, v):
+        if self._reverse is None:
+            reverse = [[] for _ in range(len(self))]
+            for head in range(len(self)):
+                for neighbor in self._neighbors(head):
+                    reverse[neighbor].append(head)
+            self._reverse = reverse
+        return self._reverse[v]
+
+    def add_edge(self, x, y, weight=None):
+        vertex = self.graph[x]
+
+        # the first weighted edge gives this vertex weights, and earlier edges cost 1
+        if weight is not None and vertex.weights is None:
+            vertex.weights = [1] * len(vertex.edges)
+
+        vertex.edges.append(y)
+        if vertex.weights is not None:
+            vertex.weights.append(1 if weight is None else weight)
+
+        self._reverse = None
+        if self._reachability is not None:
+            self._reachability.add_edge(x, y)
+
+    def add(self, content=None, edges=None, weights=None):
+        self.graph.append(Vertex(content, edges, weights))
+        self._reverse = None
+        if self._index is not None:
+            self._index.setdefault(content, set()).add(len(self.graph) - 1)
+
+        if self._reachability is not None:
+            head = len(self.graph) - 1
+            if self._reachability.add_vertex():
+                for y in self._neighbors(head):
+                    self._reachability.add_edge(head, y)
+            else:
+                self._reachability = None
 
-    def add(self, content=None, edges=None):
-        self.graph.append(Vertex(content, edges))
+    def index_reachability(self, max_bytes=64 << 20):
+        """
+        attach a ReachabilityIndex so reachable() answers in O(1).  add and add_edge keep it
+        current, and it is dropped if it ever outgrows max_bytes
+        :param max_bytes: the memory budget for the index
+        :return: True if the index fits its budget and is in use
+        """
+        index = ReachabilityIndex(self, max_bytes)
+        self._reachability = index if index.reach is not None else None
+        return self._reachability is not None
+
+    def reachable(self, x, y):
+        """
+        :return: True if there is a path from x to y, using the reachability index if one
+                 is attached, or else a bidirectional search
+        """
+        if self._reachability is not None:
+            return self._reachability.reachable(x, y)
+        return self.bidirectional_search(x, y) is not None
+
+    def _matcher(self, needle):
+        """
+        :return: a predicate that is True for vertices holding needle, or None if
+                 the content index proves that no vertex holds it
+        """
+        if self._index is None:
+            return lambda v: self._content(v) == needle
+
+        # with an index, traversal only has to confirm reachability
+        matches = self._index.get(needle)
+        if not matches:
+            return None
+        return matches.__contains__
 
     def print(self):
-        for head in range(len(self.graph)):
-            print(self.graph[head].content, '=', head, end=' ')
-            for v in self.graph[head].edges:
+        for head in range(len(self)):
+            print(self._content(head), '=', head, end=' ')
+            for v in self._neighbors(head):
                 print('->', v, end=' ')
             print()
 
-    def bfs(self, needle, head=0, trace=False):
+    def iter_bfs(self, head=0, seen=None):
+        """
+        lazily yield (vertex, depth) for every vertex reachable from head, in breadth first order
+        :param head: the vertex to start from
+        :param seen: an optional bytearray of len(self) to reuse; vertices already marked
+                     in it are skipped, and visited vertices are marked as they are queued
+        """
         # track seen vertices to prevent looping
-        seen = [False] * len(self.graph)
+        if seen is None:
+            seen = bytearray(len(self))
 
-        # keep track of additional found nodes needing processing
-        # and seed the queue with our root node
-        queue = [head]
-        seen[head] = True
+        # seed the queue with our root node
+        queue = deque([(head, 0)])
+        seen[head] = 1
 
         # keep processing until queue is empty
         while queue:
+            head, depth = queue.popleft()
+            yield head, depth
+
+            # queue unseen peers for searching
+            for neighbor in self._neighbors(head):
+                if not seen[neighbor]:
+                    seen[neighbor] = 1
+                    queue.append((neighbor, depth + 1))
 
-            # define a new search root
-            head = queue.pop(0)
-            if trace:
-                print(head, end=' ')
+    def iter_dfs(self, head=0, seen=None):
+        """
+        lazily yield (vertex, depth) for every vertex reachable from head, in depth first
+        pre-order.  an explicit stack is used, so deep graphs do not hit the recursion limit
+        :param head: the vertex to start from
+        :param seen: an optional bytearray of len(self) to reuse, as in iter_bfs
+        """
+        # track seen vertices to prevent looping
+        if seen is None:
+            seen = bytearray(len(self))
 
-            # if the needle is found in this vertex, return it
-            if self.graph[head].content == needle:
-                if trace:
-                    print('found')
-                return head
+        seen[head] = 1
+        yield head, 0
 
-            # queue unseen peers for searching
-            for neighbor in self.graph[head].edges:
+        # the stack holds one neighbor iterator per vertex on the current path,
+        # so its length is also the depth of the next vertex found
+        stack = [iter(self._neighbors(head))]
+        while stack:
+            for neighbor in stack[-1]:
+                # descend into the first unseen neighbor, and resume this
+                # vertex's remaining neighbors once that subtree is done
                 if not seen[neighbor]:
-                    seen[neighbor] = True
+                    seen[neighbor] = 1
+                    yield neighbor, len(stack)
+                    stack.append(iter(self._neighbors(neighbor)))
+                    break
+            else:
+                stack.pop()
+
+    def connected_components(self):
+        """
+        label the weakly connected components, treating every edge as undirected
+        :return: an array('i') of len(self) component labels, numbered from 0 in order of
+                 each component's lowest vertex
+        """
+        # union find with path halving, always linking the higher root under the lower one
+        root = array('i', range(len(self)))
+        for head in range(len(self)):
+            for neighbor in self._neighbors(head):
+                x, y = head, neighbor
+                while root[x] != x:
+                    root[x] = root[root[x]]
+                    x = root[x]
+                while root[y] != y:
+                    root[y] = root[root[y]]
+                    y = root[y]
+                if x < y:
+                    root[y] = x
+                elif y < x:
+                    root[x] = y
+
+        # a root is its component's lowest vertex, so every root is labelled before its members
+        labels = array('i', [-1]) * len(self)
+        count = 0
+        for v in range(len(self)):
+            x = v
+            while root[x] != x:
+                x = root[x]
+            if labels[x] < 0:
+                labels[x] = count
+                count += 1
+            labels[v] = labels[x]
+        return labels
+
+    def strongly_connected_components(self):
+        """
+        label the strongly connected components with an iterative tarjan, so deep graphs
+        do not hit the recursion limit
+        :return: an array('i') of len(self) component labels.  components are numbered in
+                 reverse topological order: every edge between two components leads from the
+                 higher label to the lower one
+        """
+        return _strong_components(self)[0]
+
+    def shortest_paths(self, sources):
+        """
+        run a single breadth first search outward from every source at once
+        :param sources: an iterable of vertices at distance 0
+        :return: (distance, parent) as array('i') of len(self).  unreached vertices have a
+                 distance of -1, and sources and unreached vertices have a parent of -1
+        """
+        distance = array('i', [-1]) * len(self)
+        parent = array('i', [-1]) * len(self)
+
+        # seed the queue with every source
+        queue = deque()
+        for head in sources:
+            if distance[head] < 0:
+                distance[head] = 0
+                queue.append(head)
+
+        # a vertex's distance is final the first time any source's frontier reaches it
+        while queue:
+            head = queue.popleft()
+            depth = distance[head] + 1
+            for neighbor in self._neighbors(head):
+                if distance[neighbor] < 0:
+                    distance[neighbor] = depth
+                    parent[neighbor] = head
                     queue.append(neighbor)
 
+        return distance, parent
+
+    def parallel_shortest_paths(self, sources, workers=None, serial_cutoff=1024):
+        """
+        a level synchronous breadth first search whose frontier levels are expanded by a
+        process pool.  the adjacency is split into shards in shared memory, balanced by edge
+        count, and each level's frontier is expanded shard by shard in parallel.  results
+        are merged here through a visited bitmap that is also in shared memory
+        :param sources: an iterable of vertices at distance 0
+        :param workers: the number of worker processes, by default one per cpu
+        :param serial_cutoff: expand frontiers smaller than this in-process
+        :return: (distance, timings), where distance matches shortest_paths and timings
+                 lists the seconds spent on each level
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        csr = self if isinstance(self, CSRGraph) else CSRGraph.from_graph(self)
+        n = len(csr)
+        m = len(csr.targets)
+        if not n:
+            return array('i'), []
+
+        # split the vertices into contiguous ranges with about the same number of edges
+        starts = {0}
+        for i in range(1, workers):
+            starts.add(min(bisect_left(csr.offsets, i * m // workers), n - 1))
+        starts = sorted(starts)
+        bounds = list(zip(starts, starts[1:] + [n]))
+
+        blocks = []
+        try:
+            # size=0 is not allowed, so every block holds at least one byte
+            visited = shared_memory.SharedMemory(create=True, size=max(1, (n + 7) // 8))
+            blocks.append(visited)
+
+            # copy each shard's offsets, rebased to its first edge, followed by its targets
+            shards = []
+            for lo, hi in bounds:
+                base = csr.offsets[lo]
+                offsets = array('q', [offset - base for offset in csr.offsets[lo:hi + 1]])
+                targets = csr.targets[base:csr.offsets[hi]]
+                split = 8 * len(offsets)
+                shard = shared_memory.SharedMemory(create=True, size=max(1, split + 4 * len(targets)))
+                blocks.append(shard)
+                shard.buf[:split] = offsets.tobytes()
+                shard.buf[split:split + 4 * len(targets)] = targets.tobytes()
+                shards.append((shard.name, lo, hi - lo, len(targets)))
+
+            distance = array('i', [-1]) * n
+            frontier = array('i')
+            for head in sources:
+                if distance[head] < 0:
+                    distance[head] = 0
+                    visited.buf[head >> 3] |= 1 << (head & 7)
+                    frontier.append(head)
+
+            timings = []
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                depth = 0
+                while frontier:
+                    started = time.perf_counter()
+                    depth += 1
+
+                    if len(frontier) < serial_cutoff:
+                        found = [_expand_frontier(csr.offsets, csr._targets_view, 0, visited.buf, frontier)]
+                    else:
+                        # group the frontier by owning shard and expand every shard at once
+                        parts = [array('i') for _ in shards]
+                        for head in frontier:
+                            parts[bisect_right(starts, head) - 1].append(head)
+                        found = [pool.submit(_expand_shard, *shard, visited.name, part)
+                                 for shard, part in zip(shards, parts) if part]
+                        found = [future.result() for future in found]
+
+                    # shards may discover the same vertex, so merge through the bitmap
+                    frontier = array('i')
+                    for part in found:
+                        for head in part:
+                            if not visited.buf[head >> 3] & (1 << (head & 7)):
+                                visited.buf[head >> 3] |= 1 << (head & 7)
+                                distance[head] = depth
+                                frontier.append(head)
+
+                    timings.append(time.perf_counter() - started)
+
+            return distance, timings
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    def dijkstra(self, src, dst=None):
+        """
+        find the cheapest paths from src over weighted edges.  edges added without a weight
+        cost 1, and weights must not be negative
+        :param src: the vertex to start from
+        :param dst: stop as soon as the cost to dst is final
+        :return: (distance, parent) arrays of len(self), as array('d') and array('i').
+                 unreached vertices have an infinite distance and a parent of -1.  when
+                 stopping early at dst, only vertices settled before dst are final
+        """
+        distance = array('d', [math.inf]) * len(self)
+        parent = array('i', [-1]) * len(self)
+        settled = bytearray(len(self))
+
+        distance[src] = 0
+        heap = [(0, src)]
+        while heap:
+            cost, head = heappop(heap)
+
+            # rather than updating a vertex's place in the heap, it is pushed again
+            # when its cost drops, and the stale entries are skipped here
+            if settled[head]:
+                continue
+            settled[head] = 1
+            if head == dst:
+                break
+
+            for neighbor, weight in self._weighted_neighbors(head):
+                if weight < 0:
+                    raise ValueError('negative edge weight from %s to %s' % (head, neighbor))
+                if cost + weight < distance[neighbor]:
+                    distance[neighbor] = cost + weight
+                    parent[neighbor] = head
+                    heappush(heap, (cost + weight, neighbor))
+
+        return distance, parent
+
+    def astar(self, src, dst, heuristic):
+        """
+        find the cheapest path from src to dst, searching toward dst first
+        :param src: the vertex to start from
+        :param dst: the vertex to reach
+        :param heuristic: a callable taking a vertex and estimating its cost to dst.
+                          it must never overestimate, or the path found may not be cheapest
+        :return: a tuple of (cost, path), or (None, None) if dst is unreachable
+        """
+        # only the vertices explored are tracked, since a good heuristic explores few
+        cost = {src: 0}
+        parent = {src: -1}
+        heap = [(heuristic(src), 0, src)]
+        while heap:
+            _, head_cost, head = heappop(heap)
+
+            # skip entries superseded by a cheaper path to the same vertex
+            if head_cost > cost[head]:
+                continue
+
+            if head == dst:
+                path = []
+                while head != -1:
+                    path.append(head)
+                    head = parent[head]
+                path.reverse()
+                return head_cost, path
+
+            for neighbor, weight in self._weighted_neighbors(head):
+                if weight < 0:
+                    raise ValueError('negative edge weight from %s to %s' % (head, neighbor))
+                if neighbor not in cost or head_cost + weight < cost[neighbor]:
+                    cost[neighbor] = head_cost + weight
+                    parent[neighbor] = head
+                    heappush(heap, (head_cost + weight + heuristic(neighbor), head_cost + weight, neighbor))
+
+        return None, None
+
+    def hop_counts(self, pairs):
+        """
+        answer many (src, dst) hop count queries.  queries sharing a source share one search,
+        which stops as soon as every destination asked of that source has been reached
+        :param pairs: an iterable of (src, dst) vertex pairs
+        :return: a list of hop counts in query order, None where dst is unreachable from src
+        """
+        pairs = list(pairs)
+
+        # group destinations by source
+        wanted = {}
+        for src, dst in pairs:
+            wanted.setdefault(src, set()).add(dst)
+
+        found = {}
+        for src, dsts in wanted.items():
+            remaining = len(dsts)
+            for head, depth in self.iter_bfs(src):
+                if head in dsts:
+                    found[src, head] = depth
+                    remaining -= 1
+                    if not remaining:
+                        break
+
+        return [found.get(pair) for pair in pairs]
+
+    def bidirectional_search(self, src, dst, path=False):
+        """
+        find the hop distance from src to dst by searching forward from src and backward
+        from dst, one level at a time from whichever frontier is smaller, until they meet
+        :param src: the vertex to start from
+        :param dst: the vertex to reach
+        :param path: also return the vertices on a shortest path from src to dst
+        :return: the hop distance, or None if dst is unreachable.  with path=True, a tuple
+                 of (distance, path), or (None, None)
+        """
+        # for each side, map every visited vertex to (parent, depth)
+        sides = ({src: (-1, 0)}, {dst: (-1, 0)})
+        frontiers = [[src], [dst]]
+        adjacency = (self._neighbors, self._reverse_neighbors)
+
+        # the searches already meet when src is dst
+        best = (0, src) if src == dst else None
+
+        while best is None and frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            seen, other, neighbors = sides[side], sides[1 - side], adjacency[side]
+
+            # expand the whole level before stopping, since the first meeting vertex
+            # found is not necessarily on a shortest path
+            frontier = []
+            for head in frontiers[side]:
+                depth = seen[head][1] + 1
+                for neighbor in neighbors(head):
+                    if neighbor not in seen:
+                        seen[neighbor] = (head, depth)
+                        frontier.append(neighbor)
+                        if neighbor in other:
+                            distance = depth + other[neighbor][1]
+                            if best is None or distance < best[0]:
+                                best = (distance, neighbor)
+            frontiers[side] = frontier
+
+        if best is None:
+            return (None, None) if path else None
+
+        distance, meet = best
+        if not path:
+            return distance
+
+        # walk parents from the meeting vertex back to each end
+        halves = ([], [])
+        for side, half in zip(sides, halves):
+            head = meet
+            while head != -1:
+                half.append(head)
+                head = side[head][0]
+        halves[0].reverse()
+        return distance, halves[0] + halves[1][1:]
+
+    def _search(self, needle, traversal, trace):
+        # the content index can answer a miss without searching
+        is_match = self._matcher(needle)
+
+        if is_match is not None:
+            for head, _ in traversal:
+                if trace:
+                    print(head, end=' ')
+
+                # if the needle is found in this vertex, return it
+                if is_match(head):
+                    if trace:
+                        print('found')
+                    return head
+
         # if the needle is not found, return None
         if trace:
             print('not found')
         return None
 
+    def bfs(self, needle, head=0, trace=False):
+        return self._search(needle, self.iter_bfs(head), trace)
+
     def dfs(self, needle, head=0, trace=False, seen=None):
-        # track seen vertices to prevent looping
-        seen = [False] * len(self.graph)
+        return self._search(needle, self.iter_dfs(head, seen), trace)
 
-        def _dfs(self, needle, head, trace, seen):
-            if trace:
-                print(head, end=' ')
 
-            # if this vertex contains the needle, return this vertex index
-            # seen is now irrelevant, but we return it anyway (we could return None instead)
-            if self.graph[head].content == needle:
-                if trace:
-                    print('found')
-                return head, seen
+class CSRGraph(Graph):
+    """
+    a frozen graph stored in compressed sparse row form.  the neighbors of vertex v are
+    targets[offsets[v]:offsets[v + 1]], so traversals walk two contiguous arrays instead of
+    one python list per vertex
+    """
 
-            # for each neighbor, recurse into it to search
-            for neighbor in self.graph[head].edges:
-                result = None
+    def __init__(self, offsets, targets, contents=None, index_content=False, weights=None):
+        """
+        :param offsets: an array('q') of len(vertices) + 1 edge offsets
+        :param targets: an array('i') of edge targets, grouped by source vertex
+        :param contents: a list of vertex contents, or None if vertices have no content
+        :param index_content: build a content -> vertices index, as in Graph
+        :param weights: an array('d') of edge weights parallel to targets, or None if
+                        edges are unweighted
+        """
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.contents = contents
+        self._index = None
+        if index_content:
+            self._index = _index_contents(contents if contents is not None else [None] * len(self))
+        self._reverse = None
+        self._reachability = None
 
-                # only recurse into a neighbor if it has not been seen before
-                if not seen[neighbor]:
-                    seen[neighbor] = True
-                    result, seen = _dfs(self, needle, neighbor, trace, seen)
+        # set when the arrays are views of a memory mapped file
+        self._mapped = None
 
-                # if the result is ever a value other than None, we have success
-                # seen is now irrelevant, but we return it anyway (we could return None instead)
-                if result is not None:
-                    return result, seen
+        # slicing a memoryview does not copy the underlying targets
+        self._targets_view = memoryview(targets)
+        self._weights_view = memoryview(weights) if weights is not None else None
 
-            # if we reached this point, this subtree does not contain the needle
-            # return None and the updated seen list
-            return None, seen
+    @classmethod
+    def from_graph(cls, g):
+        """
+        freeze an existing graph
+        :param g: the Graph to copy
+        :return: a CSRGraph with the same vertices, contents and edge order
+        """
+        offsets = array('q', [0])
+        targets = array('i')
+        contents = []
+        for head in range(len(g)):
+            contents.append(g._content(head))
+            targets.extend(g._neighbors(head))
+            offsets.append(len(targets))
 
-        result, _ = _dfs(self, needle, head, trace, seen)
-        if trace and result is None:
-            print('not found')
-        return result
+        # only keep weights if some edge has one
+        weights = None
+        if any(g.graph[head].weights is not None for head in range(len(g))):
+            weights = array('d')
+            for head in range(len(g)):
+                weights.extend(weight for _, weight in g._weighted_neighbors(head))
+
+        return cls(offsets, targets, contents, index_content=g._index is not None, weights=weights)
+
+    @classmethod
+    def load(cls, path):
+        """
+        open a file written by save, in either version of the format.  the adjacency is not read up front: offsets and
+        targets are views of a read-only memory map, so pages load as they are traversed
+        :param path: the file to open
+        :return: a CSRGraph without vertex contents.  call close() to release the file
+        """
+        with open(path, 'rb') as f:
+            # mmap refuses empty files, which are no more a graph than any other short file
+            if os.fstat(f.fileno()).st_size < _CSR1_HEADER.size:
+                raise ValueError('not a csr graph file: %s' % path)
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if mapped[:8] == _CSR1_MAGIC:
+                header = _CSR1_HEADER
+                magic, n, m = header.unpack_from(mapped)
+                weighted = False
+            elif len(mapped) >= _CSR_HEADER.size:
+                header = _CSR_HEADER
+                magic, n, m, weighted = header.unpack_from(mapped)
+            else:
+                raise ValueError('not a csr graph file: %s' % path)
+            split = header.size + 8 * (n + 1)
+            end = split + 4 * m
+            size = end + (4 * (m % 2) + 8 * m if weighted else 0)
+            if magic not in (_CSR_MAGIC, _CSR1_MAGIC) or len(mapped) != size:
+                raise ValueError('not a csr graph file: %s' % path)
+        except Exception:
+            mapped.close()
+            raise
+
+        view = memoryview(mapped)
+        offsets = view[header.size:split].cast('q')
+        targets = view[split:end].cast('i')
+        weights = view[size - 8 * m:].cast('d') if weighted else None
+
+        # big endian hosts cannot use the little endian file in place
+        if sys.byteorder != 'little':
+            offsets, targets = array('q', offsets), array('i', targets)
+            offsets.byteswap()
+            targets.byteswap()
+            if weights is not None:
+                weights = array('d', weights)
+                weights.byteswap()
+
+        graph = cls(offsets, targets, weights=weights)
+        graph._mapped = mapped
+        return graph
+
+    def save(self, path):
+        """
+        write the adjacency, but not vertex contents, in the binary format read by load
+        :param path: the file to write
+        """
+        m = len(self.targets)
+        with open(path, 'wb') as f:
+            f.write(_CSR_HEADER.pack(_CSR_MAGIC, len(self), m, self.weights is not None))
+            sections = [('q', self.offsets), ('i', self.targets)]
+            if self.weights is not None:
+                sections.append(('B', bytes(4 * (m % 2))))
+                sections.append(('d', self.weights))
+
+            for typecode, values in sections:
+                if sys.byteorder != 'little':
+                    values = array(typecode, values)
+                    values.byteswap()
+                f.write(values)
+
+    def close(self):
+        """
+        release the memory map behind a graph opened with load.  the graph is unusable afterwards
+        """
+        if self._mapped is not None:
+            for values in (self._targets_view, self._weights_view, self.offsets, self.targets, self.weights):
+                if isinstance(values, memoryview):
+                    values.release()
+            self._mapped.close()
+            self._mapped = None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _content(self, v):
+        if self.contents is None:
+            return None
+        return self.contents[v]
+
+    def _neighbors(self, v):
+        return self._targets_view[self.offsets[v]:self.offsets[v + 1]]
+
+    def _weighted_neighbors(self, v):
+        if self._weights_view is None:
+            return zip(self._neighbors(v), repeat(1))
+        return zip(self._neighbors(v), self._weights_view[self.offsets[v]:self.offsets[v + 1]])
+
+    def _reverse_neighbors(self, v):
+        if self._reverse is None:
+            # the transpose is itself stored in csr form, grouped by target
+            offsets = _count_offsets(self.targets, len(self))
+            sources = array('i', bytes(4 * len(self.targets)))
+            cursor = offsets[:-1]
+            for head in range(len(self)):
+                for neighbor in self._neighbors(head):
+                    sources[cursor[neighbor]] = head
+                    cursor[neighbor] += 1
+            self._reverse = offsets, memoryview(sources)
+
+        offsets, sources = self._reverse
+        return sources[offsets[v]:offsets[v + 1]]
+
+    def add_edge(self, x, y, weight=None):
+        raise FrozenGraphError()
+
+    def add(self, content=None, edges=None, weights=None):
+        raise FrozenGraphError()
+
+
+class CSRBuilder:
+    """
+    collect vertices and edges in any order and build a CSRGraph without
+    creating a Vertex per node
+    """
+
+    def __init__(self):
+        # contents stay None until a vertex with content is added
+        self.contents = None
+        self._vertex_count = 0
+        self._sources = array('i')
+        self._targets = array('i')
+
+        # weights stay None until a weighted edge is added
+        self._weights = None
+
+    def __len__(self):
+        return self._vertex_count
+
+    def add_edge(self, x, y, weight=None):
+        # the first weighted edge gives the graph weights, and earlier edges cost 1
+        if weight is not None and self._weights is None:
+            self._weights = array('d', [1]) * len(self._targets)
+
+        self._sources.append(x)
+        self._targets.append(y)
+        if self._weights is not None:
+            self._weights.append(1 if weight is None else weight)
+
+    def add_edges(self, sources, targets):
+        """
+        add many edges at once
+        :param sources: an array('i') or iterable of source vertices
+        :param targets: an array('i') or iterable of target vertices, paired with sources
+        """
+        self._sources.extend(sources)
+        self._targets.extend(targets)
+        if len(self._sources) != len(self._targets):
+            raise ValueError('sources and targets differ in length')
+        if self._weights is not None:
+            self._weights.extend(repeat(1, len(self._targets) - len(self._weights)))
+
+    def add(self, content=None, edges=None, weights=None):
+        if weights is not None:
+            edges = None if edges is None else list(edges)
+            weights = list(weights)
+            _check_weights(edges, weights)
+
+        head = self._vertex_count
+        if content is not None and self.contents is None:
+            self.contents = [None] * head
+        if self.contents is not None:
+            self.contents.append(content)
+        self._vertex_count += 1
+
+        if edges is not None:
+            if weights is None:
+                weights = repeat(None)
+            for y, weight in zip(edges, weights):
+                self.add_edge(head, y, weight)
+
+    def add_vertices(self, count):
+        """
+        add count vertices without content or edges
+        """
+        if self.contents is not None:
+            self.contents.extend([None] * count)
+        self._vertex_count += count
+
+    def build(self, index_content=False):
+        """
+        :param index_content: build a content -> vertices index on the result
+        :return: a CSRGraph whose per-vertex edge order matches the order edges were added
+        """
+        n = self._vertex_count
+        for vertices in (self._sources, self._targets):
+            if vertices and (min(vertices) < 0 or max(vertices) >= n):
+                raise IndexError()
+
+        # count the out-degree of every vertex, then prefix sum into offsets
+        offsets = _count_offsets(self._sources, n)
+
+        # place each edge in its source's slot (a stable counting sort)
+        targets = array('i', bytes(4 * len(self._targets)))
+        cursor = offsets[:-1]
+        for x, y in zip(self._sources, self._targets):
+            targets[cursor[x]] = y
+            cursor[x] += 1
+
+        # weights follow their edges through the same sort
+        weights = None
+        if self._weights is not None:
+            weights = array('d', bytes(8 * len(self._weights)))
+            cursor = offsets[:-1]
+            for x, weight in zip(self._sources, self._weights):
+                weights[cursor[x]] = weight
+                cursor[x] += 1
+
+        contents = list(self.contents) if self.contents is not None else None
+        return CSRGraph(offsets, targets, contents, index_content, weights)
+
+
+class ReachabilityIndex:
+    """
+    the transitive closure of a graph over its strongly connected components.  each
+    component keeps a bitset (a python int) of the components it can reach, so a query is
+    one bit test.  inserted edges and vertices update the closure in place rather than
+    rebuilding it: components found at build time are never merged, which keeps every
+    answer correct at the cost of some redundant bits
+    """
+
+    def __init__(self, g, max_bytes=64 << 20):
+        """
+        :param g: the graph to index
+        :param max_bytes: the memory budget for the bitsets.  if the index would exceed it,
+                          reach is None and the index must not be used
+        """
+        self.max_bytes = max_bytes
+        self.component, count = _strong_components(g)
+
+        # edges to vertices that do not exist yet, by target
+        self._pending = {}
+
+        self.reach = None
+        if not self._fits(count):
+            return
+
+        # group vertices by component
+        offsets = _count_offsets(self.component, count)
+        members = array('i', bytes(4 * len(g)))
+        cursor = offsets[:-1]
+        for v in range(len(g)):
+            members[cursor[self.component[v]]] = v
+            cursor[self.component[v]] += 1
+
+        # every edge out of a component leads to a lower label, so by the time a
+        # component is visited, everything it leads to is complete
+        reach = [0] * count
+        for c in range(count):
+            bits = 1 << c
+            for v in members[offsets[c]:offsets[c + 1]]:
+                for neighbor in g._neighbors(v):
+                    if neighbor >= len(g):
+                        self._pending.setdefault(neighbor, []).append(v)
+                    else:
+                        bits |= reach[self.component[neighbor]]
+            reach[c] = bits
+        self.reach = reach
+
+    def _fits(self, count):
+        # budget for the worst case, where every component reaches every other
+        return count * count <= 8 * self.max_bytes
+
+    def reachable(self, x, y):
+        return bool(self.reach[self.component[x]] >> self.component[y] & 1)
+
+    def add_vertex(self):
+        """
+        record a new vertex, in a component of its own, along with any edges already
+        added toward it
+        :return: False if the index no longer fits its budget
+        """
+        if not self._fits(len(self.reach) + 1):
+            return False
+
+        v = len(self.component)
+        self.component.append(len(self.reach))
+        self.reach.append(1 << len(self.reach))
+        for x in self._pending.pop(v, ()):
+            self.add_edge(x, v)
+        return True
+
+    def add_edge(self, x, y):
+        # an edge toward a vertex that does not exist yet takes effect when it is added
+        if y >= len(self.component):
+            self._pending.setdefault(y, []).append(x)
+            return
+
+        cx = self.component[x]
+        cy = self.component[y]
+        if self.reach[cx] >> cy & 1:
+            return
+
+        # whatever reaches x now also reaches everything y reaches
+        gained = self.reach[cy]
+        bit = 1 << cx
+        for c in range(len(self.reach)):
+            if self.reach[c] & bit:
+                self.reach[c] |= gained
+
+
+def load_edge_list(path, binary=False, vertex_count=None, chunk_size=1 << 20):
+    """
+    stream an edge list file into a CSRGraph, a chunk at a time, without creating a Vertex
+    per node.  text files hold one "source target" pair per line, and anything after a '#'
+    is ignored.  binary files hold little endian int32 source, target pairs
+    :param path: the file to read
+    :param binary: read the binary format instead of text
+    :param vertex_count: the number of vertices, by default one more than the largest id
+    :param chunk_size: about how many bytes to read at a time
+    :return: a CSRGraph without vertex contents
+    """
+    builder = CSRBuilder()
+    largest = -1
+    line_number = 0
+
+    with open(path, 'rb' if binary else 'r') as f:
+        if binary:
+            # whole pairs only, so each chunk splits evenly into sources and targets
+            size = max(8, chunk_size - chunk_size % 8)
+            chunks = iter(lambda: f.read(size), b'')
+        else:
+            chunks = iter(lambda: f.readlines(chunk_size), [])
+
+        for chunk in chunks:
+            if binary:
+                edges = array('i', chunk)
+                if sys.byteorder != 'little':
+                    edges.byteswap()
+                if len(edges) % 2:
+                    raise ValueError('edge list has an unpaired vertex: %s' % path)
+            else:
+                edges = array('i')
+                for line in chunk:
+                    line_number += 1
+                    fields = line.partition('#')[0].split()
+                    if not fields:
+                        continue
+                    try:
+                        source, target = map(int, fields)
+                    except ValueError:
+                        raise ValueError('%s:%d: expected "source target", not %r'
+                                         % (path, line_number, line.rstrip('\n'))) from None
+                    edges.append(source)
+                    edges.append(target)
+
+            if edges:
+                largest = max(largest, max(edges))
+            builder.add_edges(edges[0::2], edges[1::2])
+
+    if vertex_count is None:
+        vertex_count = largest + 1
+    builder.add_vertices(vertex_count)
+    return builder.build()
 
 
 if __name__ == "__main__":
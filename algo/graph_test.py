@@ -1,9 +1,14 @@
+import os
+import struct
+import tempfile
 import unittest
+from array import array
+
 import graph
 
 
-def _create_graph():
-    g = graph.Graph()
+def _create_graph(index_content=False):
+    g = graph.Graph(index_content)
     g.add('a', [1, 2, 5])
     g.add('b', [0])
     g.add('c', [4])
@@ -29,6 +34,289 @@ class TestGraph(unittest.TestCase):
         self.assertEqual(g.dfs('e', 3), 4)
         self.assertEqual(g.dfs('d', 3), 3)
 
+    def test_graph_content_index(self):
+        g = _create_graph(index_content=True)
+        self.assertEqual(g.bfs('e', 0), 4)
+        self.assertEqual(g.bfs('d', 0), None)
+        self.assertEqual(g.bfs('z', 0), None)
+        self.assertEqual(g.dfs('e', 3), 4)
+        self.assertEqual(g.dfs('d', 3), 3)
+        self.assertEqual(g.dfs('z', 3), None)
+
+        # duplicate content is found at the nearest reachable vertex
+        g.add('e')
+        g.add_edge(0, 6)
+        self.assertEqual(g.bfs('e', 0), 6)
+        self.assertEqual(g.bfs('e', 4), 4)
+
+        csr = graph.CSRGraph.from_graph(g)
+        self.assertEqual(csr.bfs('e', 5), 6)
+        self.assertEqual(csr.bfs('e', 2), 4)
+        self.assertEqual(csr.bfs('z', 5), None)
+
+    def test_graph_iter_bfs(self):
+        g = _create_graph()
+        self.assertEqual(list(g.iter_bfs(3)), [(3, 0), (1, 1), (2, 1), (0, 2), (4, 2), (5, 3)])
+
+        # stopping early leaves the rest of the traversal unvisited
+        seen = bytearray(len(g))
+        for head, depth in g.iter_bfs(3, seen):
+            if depth == 1:
+                break
+        self.assertEqual(list(seen), [0, 1, 1, 1, 0, 0])
+
+    def test_graph_iter_dfs(self):
+        g = _create_graph()
+        self.assertEqual(list(g.iter_dfs(3)), [(3, 0), (1, 1), (0, 2), (2, 3), (4, 4), (5, 3)])
+
+        # a long path would exceed the recursion limit if searched recursively
+        g = graph.Graph()
+        for i in range(10000):
+            g.add(i, [i + 1])
+        g.add('end')
+        self.assertEqual(g.dfs('end'), 10000)
+
+    def test_graph_connected_components(self):
+        g = _create_graph()
+        g.add('g')
+        g.add('h', [6])
+        self.assertEqual(list(g.connected_components()), [0, 0, 0, 0, 0, 0, 1, 1])
+
+    def test_graph_strongly_connected_components(self):
+        g = _create_graph()
+        labels = g.strongly_connected_components()
+        self.assertEqual(labels[0], labels[1])
+        self.assertEqual(labels[0], labels[5])
+        self.assertEqual(len(set(labels)), 4)
+        for head in range(len(g)):
+            for neighbor in g._neighbors(head):
+                self.assertGreaterEqual(labels[head], labels[neighbor])
+
+        # one long cycle would exceed the recursion limit if searched recursively
+        g = graph.Graph()
+        for i in range(10000):
+            g.add(i, [(i + 1) % 10000])
+        self.assertEqual(set(g.strongly_connected_components()), {0})
+
+    def test_graph_shortest_paths(self):
+        g = _create_graph()
+        distance, parent = g.shortest_paths([3])
+        self.assertEqual(list(distance), [2, 1, 1, 0, 2, 3])
+        self.assertEqual(list(parent), [1, 3, 3, -1, 2, 0])
+
+        distance, parent = g.shortest_paths([2, 5])
+        self.assertEqual(list(distance), [1, 2, 0, -1, 1, 0])
+        self.assertEqual(list(parent), [5, 0, -1, -1, 2, -1])
+
+    def test_graph_parallel_shortest_paths(self):
+        g = _create_graph()
+        distance, timings = g.parallel_shortest_paths([2, 5], workers=2, serial_cutoff=0)
+        self.assertEqual(distance, g.shortest_paths([2, 5])[0])
+        self.assertEqual(len(timings), 3)
+
+        distance, _ = g.parallel_shortest_paths([3], workers=2)
+        self.assertEqual(distance, g.shortest_paths([3])[0])
+
+    def test_graph_dijkstra(self):
+        g = _create_graph()
+        distance, parent = g.dijkstra(3)
+        self.assertEqual(list(distance), [2, 1, 1, 0, 2, 3])
+
+        # weighting one edge keeps the others at a cost of 1
+        g.add_edge(3, 4, 0.5)
+        g.add_edge(1, 5, 10)
+        distance, parent = g.dijkstra(3)
+        self.assertEqual(list(distance), [2, 1, 1, 0, 0.5, 3])
+        self.assertEqual(list(parent), [1, 3, 3, -1, 3, 0])
+        self.assertEqual(g.graph[3].weights, [1, 1, 0.5])
+        self.assertIsNone(g.graph[0].weights)
+
+        distance, _ = g.dijkstra(3, dst=4)
+        self.assertEqual(distance[4], 0.5)
+
+        g.add_edge(0, 3, -1)
+        self.assertRaises(ValueError, g.dijkstra, 0)
+
+    def test_graph_weights_mismatch(self):
+        g = graph.Graph()
+        self.assertRaises(ValueError, g.add, 'a', [1, 2], [5])
+        self.assertRaises(ValueError, g.add, 'a', weights=[3])
+        self.assertEqual(len(g), 0)
+
+        b = graph.CSRBuilder()
+        self.assertRaises(ValueError, b.add, 'a', [1, 2], [5])
+        self.assertRaises(ValueError, b.add, 'a', None, [5])
+        self.assertEqual(len(b), 0)
+        b.add('a', iter([1, 2]), iter([5, 6]))
+        b.add_vertices(2)
+        self.assertEqual(list(b.build()._weighted_neighbors(0)), [(1, 5), (2, 6)])
+
+    def test_graph_astar(self):
+        g = graph.Graph()
+        for i in range(5):
+            g.add(i)
+        g.add_edge(0, 1, 1)
+        g.add_edge(1, 4, 5)
+        g.add_edge(0, 2, 2)
+        g.add_edge(2, 3, 1)
+        g.add_edge(3, 4, 1)
+        self.assertEqual(g.astar(0, 4, lambda v: 0), (4, [0, 2, 3, 4]))
+        self.assertEqual(g.astar(0, 4, lambda v: 4 - v), (4, [0, 2, 3, 4]))
+        self.assertEqual(g.astar(4, 0, lambda v: 0), (None, None))
+
+        csr = graph.CSRGraph.from_graph(g)
+        self.assertEqual(csr.astar(0, 4, lambda v: 0), (4, [0, 2, 3, 4]))
+
+    def test_graph_hop_counts(self):
+        g = _create_graph()
+        self.assertEqual(g.hop_counts([(3, 5), (3, 3), (0, 3), (3, 4), (2, 4)]),
+                         [3, 0, None, 2, 1])
+
+    def test_graph_bidirectional_search(self):
+        g = _create_graph()
+        self.assertEqual(g.bidirectional_search(3, 5), 3)
+        self.assertEqual(g.bidirectional_search(3, 5, path=True), (3, [3, 1, 0, 5]))
+        self.assertEqual(g.bidirectional_search(4, 4, path=True), (0, [4]))
+        self.assertEqual(g.bidirectional_search(0, 3), None)
+        self.assertEqual(g.bidirectional_search(0, 3, path=True), (None, None))
+
+        # adding an edge invalidates the cached reverse adjacency
+        g.add_edge(4, 3)
+        self.assertEqual(g.bidirectional_search(0, 3, path=True), (3, [0, 2, 4, 3]))
+
+        csr = graph.CSRGraph.from_graph(g)
+        self.assertEqual(list(csr._reverse_neighbors(4)), [2, 4])
+        self.assertEqual(csr.bidirectional_search(5, 3), 4)
+
+    def test_graph_reachability_index(self):
+        g = _create_graph()
+        self.assertTrue(g.index_reachability())
+        self.assertTrue(g.reachable(3, 5))
+        self.assertTrue(g.reachable(1, 1))
+        self.assertFalse(g.reachable(0, 3))
+        self.assertFalse(g.reachable(4, 2))
+
+        # new edges and vertices update the index in place
+        g.add_edge(4, 3)
+        self.assertTrue(g.reachable(0, 3))
+        g.add('g', [7])
+        g.add('h', [3])
+        self.assertTrue(g.reachable(6, 1))
+        self.assertFalse(g.reachable(0, 6))
+        self.assertIsNotNone(g._reachability)
+
+        # over budget, queries fall back to searching
+        self.assertFalse(g.index_reachability(max_bytes=1))
+        self.assertTrue(g.reachable(6, 1))
+        self.assertFalse(g.reachable(0, 6))
+
+    def test_graph_reachability_forward_edges(self):
+        # edges toward vertices that are added later, as _create_graph does
+        g = graph.Graph()
+        g.add('a', [1])
+        self.assertTrue(g.index_reachability())
+        self.assertTrue(g.reachable(0, 0))
+        g.add('b', [2])
+        g.add('c')
+        self.assertTrue(g.reachable(0, 2))
+        self.assertFalse(g.reachable(2, 0))
+        self.assertEqual(len(g.strongly_connected_components()), 3)
+
+    def test_csr_from_graph(self):
+        g = graph.CSRGraph.from_graph(_create_graph())
+        self.assertEqual(len(g), 6)
+        self.assertEqual(list(g._neighbors(0)), [1, 2, 5])
+        self.assertEqual(g.bfs('e', 0), 4)
+        self.assertEqual(g.bfs('d', 0), None)
+        self.assertEqual(g.dfs('e', 3), 4)
+        self.assertEqual(g.dfs('d', 3), 3)
+        self.assertRaises(graph.FrozenGraphError, g.add_edge, 0, 3)
+
+    def test_csr_builder(self):
+        b = graph.CSRBuilder()
+        for content in 'abcdef':
+            b.add(content)
+        b.add_edge(3, 1)
+        b.add_edge(0, 1)
+        b.add_edge(3, 2)
+        b.add_edge(0, 2)
+        g = b.build()
+        self.assertEqual(list(g._neighbors(0)), [1, 2])
+        self.assertEqual(list(g._neighbors(3)), [1, 2])
+        self.assertEqual(list(g._neighbors(5)), [])
+        self.assertEqual(g.bfs('c', 3), 2)
+
+        b.add_edge(0, 6)
+        self.assertRaises(IndexError, b.build)
+
+    def test_csr_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.csr')
+            graph.CSRGraph.from_graph(_create_graph()).save(path)
+
+            g = graph.CSRGraph.load(path)
+            self.assertEqual(len(g), 6)
+            self.assertEqual(list(g._neighbors(3)), [1, 2])
+            self.assertEqual(g.hop_counts([(3, 5)]), [3])
+            g.close()
+
+            b = graph.CSRBuilder()
+            b.add_vertices(3)
+            b.add_edge(0, 1)
+            b.add_edge(1, 2, 0.25)
+            b.add_edge(0, 2, 2)
+            b.build().save(path)
+            g = graph.CSRGraph.load(path)
+            self.assertEqual(list(g._weighted_neighbors(0)), [(1, 1), (2, 2)])
+            self.assertEqual(list(g.dijkstra(0)[0]), [0, 1, 1.25])
+            g.close()
+
+            # files in the first, unweighted version of the format still load
+            with open(path, 'wb') as f:
+                f.write(struct.pack('<8sqq', b'ALGOCSR1', 3, 2))
+                f.write(array('q', [0, 1, 2, 2]).tobytes() + array('i', [1, 2]).tobytes())
+            g = graph.CSRGraph.load(path)
+            self.assertEqual(g.hop_counts([(0, 2)]), [2])
+            self.assertIsNone(g.weights)
+            g.close()
+
+            with open(path, 'r+b') as f:
+                f.write(b'NOTAGRPH')
+            self.assertRaises(ValueError, graph.CSRGraph.load, path)
+
+            # truncated and empty files are rejected the same way
+            for data in (b'ALGOCSR2' + bytes(16), b'ALGO', b''):
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.assertRaises(ValueError, graph.CSRGraph.load, path)
+
+    def test_load_edge_list(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'edges.txt')
+            with open(path, 'w') as f:
+                f.write('# source target\n0 1\n0 2\n\n3 1  # inline comment\n2 4\n')
+            g = graph.load_edge_list(path, chunk_size=8)
+            self.assertEqual(len(g), 5)
+            self.assertEqual(list(g._neighbors(0)), [1, 2])
+            self.assertEqual(g.shortest_paths([0])[0], array('i', [0, 1, 1, -1, 2]))
+
+            # malformed lines are reported, never paired across line breaks
+            with open(path, 'w') as f:
+                f.write('0 1 2\n3\n')
+            with self.assertRaisesRegex(ValueError, ':1: '):
+                graph.load_edge_list(path)
+            with open(path, 'w') as f:
+                f.write('0 1\n# comment\n2 x\n')
+            with self.assertRaisesRegex(ValueError, ':3: '):
+                graph.load_edge_list(path, chunk_size=4)
+
+            path = os.path.join(tmp, 'edges.bin')
+            with open(path, 'wb') as f:
+                f.write(array('i', [0, 1, 0, 2, 3, 1, 2, 4]).tobytes())
+            g = graph.load_edge_list(path, binary=True, vertex_count=6, chunk_size=8)
+            self.assertEqual(len(g), 6)
+            self.assertEqual(list(g._neighbors(3)), [1])
+
 
 if __name__ == '__main__':
     unittest.main()
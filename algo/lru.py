@@ -1,60 +1,554 @@
+import asyncio
+import functools
+import mmap
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# marks a missing key for LRUCache.get, since None may be cached
+_MISSING = object()
+
+# separates positional from keyword arguments in lru_memoize keys
+_KWARGS_MARK = object()
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'hit_ratio', 'size'])
+
+
 class LRUElement:
-    def __init__(self, key, value):
+    __slots__ = ('key', 'value', 'weight', 'prev', 'next')
+
+    def __init__(self, key, value, weight=1):
         self.key = key
         self.value = value
+        self.weight = weight
+        self.prev = None
+        self.next = None
+
 
 class LRUCache:
     """
     a cache containing the most recently accessed elements
     """
 
-    def __init__(self, capacity):
+    def __init__(self, capacity, on_evict=None, weigher=None, max_weight=None, spill=None):
         """
-        :param capacity: the number of elements to store in the cache
+        :param capacity: the number of elements to store in the cache, at least 1, or None
+                         to limit the cache by max_weight alone
+        :param on_evict: called with the key and content of every element removed
+                         to make room for another
+        :param weigher: called with the content of each element to find its weight,
+                        such as its size in bytes.  by default every element weighs 1
+        :param max_weight: the total weight of elements to store in the cache
+        :param spill: a DiskTier to keep elements removed to make room for others.
+                      a get that misses in memory looks there, and promotes what it finds
         """
+        if capacity is not None and capacity < 1:
+            raise ValueError('capacity must be at least 1, not %s' % capacity)
         self.capacity = capacity
-        self.__cache = []
+        self.on_evict = on_evict
+        self.weigher = weigher
+        self.max_weight = max_weight
+        self.total_weight = 0
+        self.spill = spill
 
-    def __shift_to_front(self, index):
-        val = self.__cache.pop(index)
-        self.__cache.insert(0, val)
+        # elements by key, each also linked into a list ordered by recency
+        self.__cache = {}
 
-    def __lookup_index_by_key(self, x):
-        for i in range(len(self.__cache)):
-            if self.__cache[i].key == x:
-                return i
+        # the list is circular around a sentinel element: the sentinel's next
+        # is the most recently accessed element, and its prev the least
+        self.__head = LRUElement(None, None)
+        self.__head.prev = self.__head.next = self.__head
 
-        raise KeyError()
+        # in-flight get_or_load tasks by key
+        self.__loading = {}
+
+    def __len__(self):
+        return len(self.__cache)
+
+    def clear(self):
+        """
+        remove every element, including those spilled to disk, without calling on_evict
+        """
+        self.__cache.clear()
+        self.__head.prev = self.__head.next = self.__head
+        self.total_weight = 0
+        if self.spill is not None:
+            self.spill.clear()
+
+    def __unlink(self, element):
+        element.prev.next = element.next
+        element.next.prev = element.prev
+
+    def __push_front(self, element):
+        element.prev = self.__head
+        element.next = self.__head.next
+        self.__head.next.prev = element
+        self.__head.next = element
+
+    def __shift_to_front(self, element):
+        self.__unlink(element)
+        self.__push_front(element)
+
+    def __over_limit(self):
+        if self.capacity is not None and len(self.__cache) > self.capacity:
+            return True
+        return self.max_weight is not None and self.total_weight > self.max_weight
 
     def __prune(self):
-        cache_size = len(self.__cache)
-        if cache_size > self.capacity:
-            del self.__cache[cache_size - 1]
+        while self.__over_limit():
+            element = self.__head.prev
+            self.__unlink(element)
+            del self.__cache[element.key]
+            self.total_weight -= element.weight
+            if self.spill is not None:
+                self.spill.put(element.key, element.value)
+            if self.on_evict is not None:
+                self.on_evict(element.key, element.value)
 
-    def get(self, x):
+    def get(self, x, default=_MISSING):
         """
         get an element from the cache by key, or raise KeyError if the element is not found
         :param x: the key to fetch
+        :param default: returned instead of raising KeyError, if given
         :return: the content related to that key
         """
-        # raises exception if key not found
-        index = self.__lookup_index_by_key(x)
+        element = self.__cache.get(x)
+        if element is None:
+            # promote from disk, which may spill another element in its place
+            if self.spill is not None and x in self.spill:
+                value = self.spill.pop(x)
+                self.set(x, value)
+                return value
+
+            if default is _MISSING:
+                raise KeyError(x)
+            return default
 
         # move this item to the front of the cache
         # to delay it from being removed
-        self.__shift_to_front(index)
+        self.__shift_to_front(element)
 
-        # prune if needed
-        self.__prune()
-
-        return self.__cache[0].value
+        return element.value
 
     def set(self, x, y):
         """
         add an element to the cache.  if the cache is already at-capacity, the least recently
-        accessed element will be removed
+        accessed elements will be removed until it fits.  an element heavier than max_weight
+        raises ValueError, and leaves the cache as it was
         :param x: the key of the object to cache
         :param y: the content of the object to cache
         """
-        self.__cache.insert(0, LRUElement(x, y))
+        self.__insert(x, y, self.__weigh(y))
+        self.__prune()
+
+    def __weigh(self, y):
+        weight = 1 if self.weigher is None else self.weigher(y)
+        if self.max_weight is not None and weight > self.max_weight:
+            raise ValueError('element weighs %s, more than max_weight %s' % (weight, self.max_weight))
+        return weight
+
+    def __insert(self, x, y, weight):
+        # replacing an element refreshes it rather than adding a duplicate
+        element = self.__cache.get(x)
+        if element is not None:
+            element.value = y
+            self.total_weight += weight - element.weight
+            element.weight = weight
+            self.__shift_to_front(element)
+        else:
+            element = LRUElement(x, y, weight)
+            self.__cache[x] = element
+            self.total_weight += weight
+            self.__push_front(element)
+
+            # the new content supersedes any spilled copy
+            if self.spill is not None:
+                self.spill.discard(x)
+
+    def get_many(self, keys):
+        """
+        get many elements at once.  elements promoted from disk are all inserted before
+        the cache is pruned, once for the whole batch
+        :param keys: an iterable of keys to fetch
+        :return: a tuple of a dict of key -> content for every key found, and a list of
+                 the keys not found
+        """
+        found = {}
+        misses = []
+        for x in keys:
+            element = self.__cache.get(x)
+            if element is not None:
+                self.__shift_to_front(element)
+                found[x] = element.value
+                continue
+
+            if self.spill is not None and x in self.spill:
+                found[x] = value = self.spill.pop(x)
+                self.__insert(x, value, self.__weigh(value))
+                continue
+
+            misses.append(x)
+
+        self.__prune()
+        return found, misses
+
+    def set_many(self, items):
+        """
+        add many elements at once, pruning the cache once for the whole batch.  if any
+        element is heavier than max_weight, ValueError is raised before any are added
+        :param items: an iterable of (key, content) pairs, least recently accessed first
+        """
+        items = [(x, y, self.__weigh(y)) for x, y in items]
+        for x, y, weight in items:
+            self.__insert(x, y, weight)
         self.__prune()
+
+    def snapshot(self):
+        """
+        :return: a list of (key, content) pairs for every element in memory, least recently
+                 accessed first, which restore() can load back in the same order
+        """
+        items = []
+        element = self.__head.prev
+        while element is not self.__head:
+            items.append((element.key, element.value))
+            element = element.prev
+        return items
+
+    def restore(self, items):
+        """
+        warm the cache from a snapshot() in one batch
+        :param items: an iterable of (key, content) pairs, least recently accessed first
+        """
+        self.set_many(items)
+
+    async def get_or_load(self, x, loader):
+        """
+        get an element from the cache, loading it on a miss.  however many tasks miss on the
+        same key at once, loader runs only once and every one of them gets its result.  if
+        loader raises, every waiting task gets the exception and nothing is cached.
+        cancelling a waiting task does not cancel the load for the others
+        :param x: the key to fetch
+        :param loader: an async callable taking the key and returning its content
+        :return: the content related to that key
+        """
+        try:
+            return self.get(x)
+        except KeyError:
+            pass
+
+        task = self.__loading.get(x)
+        if task is None:
+            task = asyncio.ensure_future(self.__load(x, loader))
+            task.add_done_callback(_retrieve_exception)
+            self.__loading[x] = task
+
+        # shield the shared task, so cancelling this waiter leaves it running
+        return await asyncio.shield(task)
+
+    async def __load(self, x, loader):
+        try:
+            value = await loader(x)
+            self.set(x, value)
+            return value
+        finally:
+            del self.__loading[x]
+
+
+def _retrieve_exception(task):
+    # every waiter on a load may have been cancelled, leaving nobody to retrieve its
+    # exception, which asyncio would otherwise log as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class DiskTier:
+    """
+    a second cache tier on local disk, for elements an LRUCache removes to make room.
+    contents are pickled and appended to a fixed size, memory mapped segment file, and
+    the tier keeps its own LRU index of each key's record.  when a record does not fit
+    at the end of the file, the least recently used records are dropped until it would
+    fit, and the live records are compacted to the front of the file
+    """
+
+    def __init__(self, size, path=None):
+        """
+        :param size: the size of the segment file in bytes
+        :param path: where to create the segment file, by default an anonymous temporary file
+        """
+        self.size = size
+        self.__file = open(path, 'w+b') if path is not None else tempfile.TemporaryFile()
+        self.__file.truncate(size)
+        self.__map = mmap.mmap(self.__file.fileno(), size)
+
+        # key -> (offset, length) of its record, least recently used first
+        self.__index = OrderedDict()
+        self.__tail = 0
+        self.live_bytes = 0
+
+    def __len__(self):
+        return len(self.__index)
+
+    def __contains__(self, x):
+        return x in self.__index
+
+    def __compact(self):
+        # slide the live records to the front in file order, so no record is
+        # overwritten before it has moved
+        tail = 0
+        for x, (offset, length) in sorted(self.__index.items(), key=lambda item: item[1][0]):
+            if offset != tail:
+                self.__map.move(tail, offset, length)
+            self.__index[x] = (tail, length)
+            tail += length
+        self.__tail = tail
+
+    def put(self, x, y):
+        """
+        write an element, replacing any earlier record of the same key
+        :return: False if the content cannot be pickled, or is larger than the whole file
+                 once pickled, and was not stored
+        """
+        self.discard(x)
+        try:
+            data = pickle.dumps(y, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            # locks, lambdas and the like are dropped rather than failing the eviction
+            return False
+        if len(data) > self.size:
+            return False
+
+        if self.__tail + len(data) > self.size:
+            while self.live_bytes + len(data) > self.size:
+                _, (_, length) = self.__index.popitem(last=False)
+                self.live_bytes -= length
+            self.__compact()
+
+        self.__map[self.__tail:self.__tail + len(data)] = data
+        self.__index[x] = (self.__tail, len(data))
+        self.__tail += len(data)
+        self.live_bytes += len(data)
+        return True
+
+    def pop(self, x, default=_MISSING):
+        """
+        remove an element and return its content, or raise KeyError if it is not found
+        :param x: the key to fetch
+        :param default: returned instead of raising KeyError, if given
+        """
+        record = self.__index.pop(x, None)
+        if record is None:
+            if default is _MISSING:
+                raise KeyError(x)
+            return default
+
+        offset, length = record
+        self.live_bytes -= length
+        return pickle.loads(self.__map[offset:offset + length])
+
+    def discard(self, x):
+        record = self.__index.pop(x, None)
+        if record is not None:
+            self.live_bytes -= record[1]
+
+    def clear(self):
+        self.__index.clear()
+        self.__tail = 0
+        self.live_bytes = 0
+
+    def close(self):
+        self.__map.close()
+        self.__file.close()
+
+
+class ShardedLRUCache:
+    """
+    a cache safe to share between threads.  keys are hashed across independently locked
+    LRUCache shards, so threads working on different shards never wait on each other.
+    recency is tracked per shard, which approximates global LRU order when keys hash evenly
+    """
+
+    def __init__(self, capacity, shards=16):
+        """
+        :param capacity: the number of elements to store across all shards, at least 1
+        :param shards: the number of shards, at most one per element of capacity
+        """
+        if capacity < 1:
+            raise ValueError('capacity must be at least 1, not %s' % capacity)
+        self.capacity = capacity
+        shards = max(1, min(shards, capacity))
+
+        # spread the capacity evenly, giving any remainder to the first shards
+        self.__shards = [LRUCache(capacity // shards + (i < capacity % shards)) for i in range(shards)]
+        self.__locks = [threading.Lock() for _ in range(shards)]
+
+        # per shard lock acquisitions, and how many of those had to wait
+        self.__acquired = [0] * shards
+        self.__contended = [0] * shards
+
+    def __len__(self):
+        return sum(len(shard) for shard in self.__shards)
+
+    def __shard(self, x):
+        return hash(x) % len(self.__shards)
+
+    def __acquire(self, i):
+        contended = not self.__locks[i].acquire(blocking=False)
+        if contended:
+            self.__locks[i].acquire()
+
+        # counters are only updated while holding the shard's lock
+        self.__acquired[i] += 1
+        self.__contended[i] += contended
+
+    def get(self, x, default=_MISSING):
+        """
+        get an element from the cache by key, or raise KeyError if the element is not found
+        :param x: the key to fetch
+        :param default: returned instead of raising KeyError, if given
+        :return: the content related to that key
+        """
+        i = self.__shard(x)
+        self.__acquire(i)
+        try:
+            return self.__shards[i].get(x, default)
+        finally:
+            self.__locks[i].release()
+
+    def set(self, x, y):
+        """
+        add an element to the cache, removing the least recently accessed element
+        of its shard if that shard is at-capacity
+        :param x: the key of the object to cache
+        :param y: the content of the object to cache
+        """
+        i = self.__shard(x)
+        self.__acquire(i)
+        try:
+            self.__shards[i].set(x, y)
+        finally:
+            self.__locks[i].release()
+
+    def get_many(self, keys):
+        """
+        get many elements at once, locking each shard once for all of its keys
+        :param keys: an iterable of keys to fetch
+        :return: a tuple of a dict of key -> content for every key found, and a list of
+                 the keys not found
+        """
+        keys = list(keys)
+        groups = {}
+        for x in keys:
+            groups.setdefault(self.__shard(x), []).append(x)
+
+        found = {}
+        for i, group in groups.items():
+            self.__acquire(i)
+            try:
+                found.update(self.__shards[i].get_many(group)[0])
+            finally:
+                self.__locks[i].release()
+
+        return found, [x for x in keys if x not in found]
+
+    def set_many(self, items):
+        """
+        add many elements at once, locking and pruning each shard once for all of its elements
+        :param items: an iterable of (key, content) pairs, least recently accessed first
+        """
+        groups = {}
+        for x, y in items:
+            groups.setdefault(self.__shard(x), []).append((x, y))
+
+        for i, group in groups.items():
+            self.__acquire(i)
+            try:
+                self.__shards[i].set_many(group)
+            finally:
+                self.__locks[i].release()
+
+    def snapshot(self):
+        """
+        :return: a list of (key, content) pairs for every element, least recently accessed
+                 first within each shard, which restore() can load back
+        """
+        items = []
+        for i, shard in enumerate(self.__shards):
+            self.__acquire(i)
+            try:
+                items.extend(shard.snapshot())
+            finally:
+                self.__locks[i].release()
+        return items
+
+    def restore(self, items):
+        """
+        warm the cache from a snapshot() in one batch per shard
+        :param items: an iterable of (key, content) pairs
+        """
+        self.set_many(items)
+
+    def stats(self):
+        """
+        :return: a list with a dict per shard of its size, capacity, lock acquisitions, and
+                 the number of acquisitions that had to wait for another thread
+        """
+        return [{'size': len(shard), 'capacity': shard.capacity,
+                 'acquired': self.__acquired[i], 'contended': self.__contended[i]}
+                for i, shard in enumerate(self.__shards)]
+
+
+def lru_memoize(capacity, ttl=None):
+    """
+    decorate a function to cache its results in an LRUCache, keyed by its arguments, which
+    must be hashable.  the decorated function gains cache_info() and cache_clear()
+    :param capacity: the number of results to cache
+    :param ttl: seconds a result stays fresh.  stale results are not swept, but are
+                recomputed the next time they are asked for
+    """
+    def decorator(func):
+        hits = misses = evictions = 0
+
+        def on_evict(key, value):
+            nonlocal evictions
+            evictions += 1
+
+        cache = LRUCache(capacity, on_evict)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            nonlocal hits, misses
+            key = args
+            if kwargs:
+                key += (_KWARGS_MARK,) + tuple(sorted(kwargs.items()))
+
+            # entries are (expiry, result), with no expiry when there is no ttl
+            entry = cache.get(key, None)
+            if entry is not None and (entry[0] is None or entry[0] > time.monotonic()):
+                hits += 1
+                return entry[1]
+
+            misses += 1
+            result = func(*args, **kwargs)
+            cache.set(key, (None if ttl is None else time.monotonic() + ttl, result))
+            return result
+
+        def cache_info():
+            """
+            :return: a CacheInfo of hits, misses, evictions, the hit ratio and the cache size
+            """
+            calls = hits + misses
+            return CacheInfo(hits, misses, evictions, hits / calls if calls else 0.0, len(cache))
+
+        def cache_clear():
+            nonlocal hits, misses, evictions
+            cache.clear()
+            hits = misses = evictions = 0
+
+        wrapper.cache_info = cache_info
+        wrapper.cache_clear = cache_clear
+        return wrapper
+
+    return decorator
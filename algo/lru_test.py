@@ -1,3 +1,8 @@
+import asyncio
+import gc
+import pickle
+import threading
+import time
 import unittest
 import lru
 
@@ -14,6 +19,281 @@ class TestLRU(unittest.TestCase):
         cache.set('f', 'F')
         self.assertRaises(KeyError, cache.get, 'b')
 
+    def test_lru_replace(self):
+        cache = lru.LRUCache(2)
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.set('a', 'AA')
+        self.assertEqual(len(cache), 2)
+        cache.set('c', 'C')
+        self.assertEqual(cache.get('a'), 'AA')
+        self.assertRaises(KeyError, cache.get, 'b')
+        self.assertEqual(cache.get('c'), 'C')
+
+    def test_lru_get_default(self):
+        cache = lru.LRUCache(2)
+        cache.set('a', None)
+        self.assertIsNone(cache.get('a', 'missing'))
+        self.assertEqual(cache.get('b', 'missing'), 'missing')
+
+    def test_lru_on_evict(self):
+        evicted = []
+        cache = lru.LRUCache(2, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.set('a', 'A')
+        cache.set('b', 'B')
+        cache.set('c', 'C')
+        self.assertEqual(evicted, [('a', 'A')])
+
+    def test_lru_weigher(self):
+        cache = lru.LRUCache(None, weigher=len, max_weight=10)
+        cache.set('a', 'AAAA')
+        cache.set('b', 'BBBB')
+        cache.get('a')
+        cache.set('c', 'CCC')
+        self.assertRaises(KeyError, cache.get, 'b')
+        self.assertEqual(cache.total_weight, 7)
+
+        # an oversize element is rejected without flushing the cache
+        self.assertRaises(ValueError, cache.set, 'd', 'D' * 11)
+        self.assertEqual(len(cache), 2)
+
+        # growing an element evicts others until the cache fits
+        cache.set('c', 'CCCCCCCC')
+        self.assertRaises(KeyError, cache.get, 'a')
+        self.assertEqual(cache.total_weight, 8)
+
+    def test_lru_spill(self):
+        tier = lru.DiskTier(4096)
+        cache = lru.LRUCache(2, spill=tier)
+        cache.set('a', 'A')
+        cache.set('b', ['B'])
+        cache.set('c', 'C')
+        self.assertEqual(len(tier), 1)
+
+        # a miss in memory promotes from disk, spilling the least recent in its place
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('a', tier)
+        self.assertIn('b', tier)
+        self.assertEqual(cache.get('b'), ['B'])
+        self.assertRaises(KeyError, cache.get, 'd')
+        self.assertIsNone(cache.get('d', None))
+        tier.close()
+
+    def test_lru_spill_unpicklable(self):
+        evicted = []
+        tier = lru.DiskTier(4096)
+        cache = lru.LRUCache(1, on_evict=lambda x, y: evicted.append(x), spill=tier)
+        cache.set('a', threading.Lock())
+
+        # the lock can't be spilled, but evicting it still succeeds and is reported
+        cache.set('b', 2)
+        self.assertEqual(cache.get('b'), 2)
+        self.assertEqual(evicted, ['a'])
+        self.assertNotIn('a', tier)
+        self.assertFalse(tier.put('c', lambda: None))
+        tier.close()
+
+    def test_disk_tier_compaction(self):
+        record = len(pickle.dumps(bytes(20), pickle.HIGHEST_PROTOCOL))
+        tier = lru.DiskTier(3 * record)
+        for i in range(3):
+            self.assertTrue(tier.put(i, bytes(20)))
+        tier.pop(0)
+        tier.pop(1)
+
+        # compaction alone makes room at the end of the file, so nothing is dropped
+        tier.put(3, bytes(20))
+        tier.put(4, bytes(20))
+        self.assertEqual([i in tier for i in range(5)], [False, False, True, True, True])
+        self.assertEqual(tier.pop(3), bytes(20))
+        tier.put(3, bytes(20))
+
+        # when compaction is not enough, the least recently used records are dropped
+        tier.put(5, bytes(20))
+        self.assertEqual([i in tier for i in range(6)], [False, False, False, True, True, True])
+        self.assertEqual(tier.live_bytes, 3 * record)
+        self.assertEqual(tier.pop(4), bytes(20))
+        self.assertFalse(tier.put('big', bytes(4 * record)))
+        tier.close()
+
+    def test_lru_get_many_set_many(self):
+        cache = lru.LRUCache(3, spill=lru.DiskTier(4096))
+        cache.set_many([('a', 'A'), ('b', 'B'), ('c', 'C'), ('d', 'D')])
+        self.assertEqual(len(cache), 3)
+        self.assertIn('a', cache.spill)
+
+        found, misses = cache.get_many(['a', 'c', 'x', 'b'])
+        self.assertEqual(found, {'a': 'A', 'b': 'B', 'c': 'C'})
+        self.assertEqual(misses, ['x'])
+        self.assertIn('d', cache.spill)
+        cache.spill.close()
+
+        cache = lru.LRUCache(None, weigher=len, max_weight=4)
+        self.assertRaises(ValueError, cache.set_many, [('a', 'A'), ('b', 'BBBBB')])
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_snapshot_restore(self):
+        cache = lru.LRUCache(3)
+        cache.set_many([('a', 'A'), ('b', 'B'), ('c', 'C')])
+        cache.get('a')
+        snapshot = cache.snapshot()
+        self.assertEqual(snapshot, [('b', 'B'), ('c', 'C'), ('a', 'A')])
+
+        warm = lru.LRUCache(3)
+        warm.restore(snapshot)
+        warm.set('d', 'D')
+        self.assertRaises(KeyError, warm.get, 'b')
+        self.assertEqual(warm.snapshot(), [('c', 'C'), ('a', 'A'), ('d', 'D')])
+
+    def test_lru_memoize(self):
+        calls = []
+
+        @lru.lru_memoize(2)
+        def square(x, offset=0):
+            calls.append(x)
+            return x * x + offset
+
+        self.assertEqual(square(2), 4)
+        self.assertEqual(square(2), 4)
+        self.assertEqual(square(2, offset=1), 5)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square(2), 4)
+        self.assertEqual(calls, [2, 2, 3, 2])
+        self.assertEqual(square.cache_info(), lru.CacheInfo(1, 4, 2, 0.2, 2))
+
+        square.cache_clear()
+        self.assertEqual(square.cache_info(), lru.CacheInfo(0, 0, 0, 0.0, 0))
+
+    def test_lru_memoize_ttl(self):
+        calls = []
+
+        @lru.lru_memoize(4, ttl=0.05)
+        def identity(x):
+            calls.append(x)
+            return x
+
+        identity(1)
+        identity(1)
+        time.sleep(0.1)
+        identity(1)
+        self.assertEqual(calls, [1, 1])
+
+    def test_lru_get_or_load(self):
+        calls = []
+
+        async def loader(key):
+            calls.append(key)
+            await asyncio.sleep(0.01)
+            return key.upper()
+
+        async def run():
+            cache = lru.LRUCache(4)
+            results = await asyncio.gather(*(cache.get_or_load('a', loader) for _ in range(10)))
+            self.assertEqual(results, ['A'] * 10)
+            self.assertEqual(await cache.get_or_load('a', loader), 'A')
+            self.assertEqual(cache.get('a'), 'A')
+
+        asyncio.run(run())
+        self.assertEqual(calls, ['a'])
+
+    def test_lru_get_or_load_errors(self):
+        attempts = []
+
+        async def flaky(key):
+            attempts.append(key)
+            await asyncio.sleep(0.01)
+            if len(attempts) == 1:
+                raise RuntimeError('unavailable')
+            return key.upper()
+
+        async def run():
+            cache = lru.LRUCache(4)
+
+            # every waiter sees the failure, and it is not cached
+            results = await asyncio.gather(*(cache.get_or_load('a', flaky) for _ in range(3)),
+                                           return_exceptions=True)
+            self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+            self.assertRaises(KeyError, cache.get, 'a')
+
+            # cancelling one waiter leaves the load running for the others
+            first = asyncio.ensure_future(cache.get_or_load('a', flaky))
+            second = asyncio.ensure_future(cache.get_or_load('a', flaky))
+            await asyncio.sleep(0)
+            first.cancel()
+            self.assertEqual(await second, 'A')
+            self.assertTrue(first.cancelled())
+
+        asyncio.run(run())
+        self.assertEqual(attempts, ['a', 'a'])
+
+    def test_lru_get_or_load_cancelled_failure(self):
+        async def failing(key):
+            await asyncio.sleep(0.01)
+            raise RuntimeError('unavailable')
+
+        async def run():
+            errors = []
+            asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+            cache = lru.LRUCache(4)
+
+            # the only waiter is cancelled, and the load then fails with nobody to see it
+            waiter = asyncio.ensure_future(cache.get_or_load('a', failing))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            await asyncio.sleep(0.05)
+            gc.collect()
+            await asyncio.sleep(0)
+            self.assertEqual(errors, [])
+            self.assertRaises(KeyError, cache.get, 'a')
+
+        asyncio.run(run())
+
+    def test_sharded_lru(self):
+        cache = lru.ShardedLRUCache(8, shards=4)
+        for i in range(8):
+            cache.set(i, i * 10)
+        self.assertEqual(cache.get(5), 50)
+        cache.set(9, 90)
+        self.assertRaises(KeyError, cache.get, 1)
+        self.assertEqual(len(cache), 8)
+
+        stats = cache.stats()
+        self.assertEqual([shard['capacity'] for shard in stats], [2, 2, 2, 2])
+        self.assertEqual(sum(shard['acquired'] for shard in stats), 11)
+
+    def test_sharded_lru_batches(self):
+        cache = lru.ShardedLRUCache(8, shards=4)
+        cache.set_many((i, i * 10) for i in range(8))
+        found, misses = cache.get_many([3, 9, 1, 12])
+        self.assertEqual(found, {3: 30, 1: 10})
+        self.assertEqual(misses, [9, 12])
+        self.assertEqual(sum(shard['acquired'] for shard in cache.stats()), 4 + 3)
+
+        warm = lru.ShardedLRUCache(8, shards=4)
+        warm.restore(cache.snapshot())
+        self.assertEqual(sorted(warm.snapshot()), sorted(cache.snapshot()))
+
+    def test_sharded_lru_threads(self):
+        cache = lru.ShardedLRUCache(1000, shards=8)
+
+        def work(offset):
+            for i in range(2000):
+                cache.set(offset + i % 500, i)
+                try:
+                    cache.get(offset + i % 250)
+                except KeyError:
+                    pass
+
+        threads = [threading.Thread(target=work, args=(n * 500,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(len(cache), 1000)
+        self.assertEqual(sum(shard['acquired'] for shard in cache.stats()), 16000)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,56 @@
-def quicksort(ary):
-    return quicksort_pythonic(ary)
+import os
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# partitions this small are insertion sorted instead of partitioned further
+_INSERTION_SORT_SIZE = 16
+
+# numeric partitions this small are sorted as python values, since each vectorized
+# partition makes several passes over its range
+_VECTOR_PARTITION_SIZE = 512
+
+
+def quicksort(ary, key=None, reverse=False, three_way=False):
+    """
+    return a sorted copy of ary.  key is called once per element.  when key or reverse is
+    given, equal elements keep their original order as they do with sorted.  a plain sort
+    uses introsort directly, which is not stable
+    :param ary: an iterable
+    :param key: a function of one value returning the value to sort by
+    :param reverse: sort in descending order
+    :param three_way: partition into less than, equal to and greater than the pivot,
+                      which is much faster when there are many duplicate values
+    :return: a new list
+    """
+    if key is None and not reverse:
+        return introsort(list(ary), three_way=three_way)
+    if key is None:
+        key = _identity
+
+    # decorate with the original index, negated when reversing, so equal keys never compare
+    # their values and come out in their original order.  the decorated entries are all
+    # distinct, so duplicate keys can't degrade the partition and three_way isn't needed
+    sign = -1 if reverse else 1
+    decorated = introsort([(key(value), sign * i, value) for i, value in enumerate(ary)])
+    if reverse:
+        decorated.reverse()
+    return [value for _, _, value in decorated]
+
+
+def _identity(value):
+    return value
 
 
 def quicksort_pythonic(ary):
-    if ary is not None:
+    if ary:
         pivot = ary[0]
         low = [i for i in ary[1:] if i <= pivot]
         high = [i for i in ary[1:] if i > pivot]
@@ -12,37 +59,364 @@ def quicksort_pythonic(ary):
         return ary
 
 
-def quicksort_traditional(ary, low=0, high=None):
+def _partition(ary, low, high):
+    # set the pivot index to left of the sortable range, which is
+    # so far the only position guaranteed to be less than the pivot value,
+    # and therefore the current pivot index
+    pi = low - 1
+
+    # this is the value we will pivot around.  the final pi will be
+    # equal to `low + (the number of values <= pivot)`
+    pivot = ary[high]
+
+    # visit every element of the array starting after the pi
+    # (which is the whole array)
+    for i in range(low, high + 1):
+        # for every element <= pivot, increase pi and swap that value with
+        # ary[pi], filling in the beginning of the array one swap at a time
+        if ary[i] <= pivot:
+            pi += 1
+            ary[i], ary[pi] = ary[pi], ary[i]
+
+    return pi
+
+
+def _partition_three_way(ary, low, high):
+    # dutch national flag partition around the pivot at high:
+    # ary[low:lt] < pivot, ary[lt:gt + 1] == pivot and ary[gt + 1:high + 1] > pivot
+    pivot = ary[high]
+    lt, i, gt = low, low, high
+    while i <= gt:
+        if ary[i] < pivot:
+            ary[lt], ary[i] = ary[i], ary[lt]
+            lt += 1
+            i += 1
+        elif pivot < ary[i]:
+            ary[i], ary[gt] = ary[gt], ary[i]
+            gt -= 1
+        else:
+            i += 1
+
+    return lt, gt
+
+
+def _median_of_three(ary, low, high):
+    # order the first, middle and last values so that the median of the
+    # three ends up at high, where _partition takes its pivot from
+    mid = (low + high) // 2
+    if ary[mid] < ary[low]:
+        ary[low], ary[mid] = ary[mid], ary[low]
+    if ary[high] < ary[low]:
+        ary[low], ary[high] = ary[high], ary[low]
+    if ary[mid] < ary[high]:
+        ary[mid], ary[high] = ary[high], ary[mid]
+
+
+def _insertion_sort(ary, low, high):
+    for i in range(low + 1, high + 1):
+        value = ary[i]
+        j = i - 1
+        while j >= low and value < ary[j]:
+            ary[j + 1] = ary[j]
+            j -= 1
+        ary[j + 1] = value
+
+
+def _sift_down(ary, low, root, end):
+    # sift ary[low + root] down the heap stored in ary[low:low + end]
+    while True:
+        child = 2 * root + 1
+        if child >= end:
+            return
+        if child + 1 < end and ary[low + child] < ary[low + child + 1]:
+            child += 1
+        if not ary[low + root] < ary[low + child]:
+            return
+        ary[low + root], ary[low + child] = ary[low + child], ary[low + root]
+        root = child
+
+
+def _heapsort(ary, low, high):
+    size = high - low + 1
+    for root in range(size // 2 - 1, -1, -1):
+        _sift_down(ary, low, root, size)
+
+    # move the largest remaining value to the end of the heap, and shrink it
+    for end in range(size - 1, 0, -1):
+        ary[low], ary[low + end] = ary[low + end], ary[low]
+        _sift_down(ary, low, 0, end)
+
+
+def introsort(ary, low=0, high=None, three_way=False):
+    """
+    sort ary in place: quicksort with median of three pivots, insertion sort for small
+    partitions, and heapsort for any partition that recurses more than 2 * log2(n) deep,
+    so the worst case is O(n log n).  pending partitions are kept on an explicit stack
+    rather than recursing
+    :param ary: a mutable sequence
+    :param low: the first index to sort
+    :param high: the last index to sort, by default the end of ary
+    :param three_way: partition into less than, equal to and greater than the pivot, so
+                      runs of duplicates are finished in one pass instead of split repeatedly
+    :return: ary
+    """
     if high is None:
         high = len(ary) - 1
 
-    def _partition(ary, low, high):
-        # set the pivot index to left of the sortable range, which is
-        # so far the only position guaranteed to be less than the pivot value,
-        # and therefore the current pivot index
-        pi = low - 1
+    stack = [(low, high, 2 * (high - low + 1).bit_length())]
+    while stack:
+        low, high, depth = stack.pop()
+        while high - low + 1 > _INSERTION_SORT_SIZE:
+            # too many bad pivots, so finish this partition in guaranteed O(n log n)
+            if depth == 0:
+                _heapsort(ary, low, high)
+                break
+            depth -= 1
+
+            _median_of_three(ary, low, high)
+            if three_way:
+                lt, gt = _partition_three_way(ary, low, high)
+            else:
+                lt = gt = _partition(ary, low, high)
+
+            # ary[lt:gt + 1] is in place.  keep working on the smaller side and stack
+            # the larger, so the stack never holds more than log2(n) partitions
+            if lt - low < high - gt:
+                stack.append((gt + 1, high, depth))
+                high = lt - 1
+            else:
+                stack.append((low, lt - 1, depth))
+                low = gt + 1
+        else:
+            _insertion_sort(ary, low, high)
+
+    return ary
+
+
+def select(ary, k, low=0, high=None):
+    """
+    introselect: rearrange ary in place so ary[k] is the value a full sort would put there,
+    with nothing greater before it and nothing less after it.  only the side of each
+    partition holding k is partitioned further, in expected O(n), with a heapsort
+    fallback after 2 * log2(n) bad pivots
+    :param ary: a mutable sequence
+    :param k: the index to select
+    :param low: the first index to consider
+    :param high: the last index to consider, by default the end of ary
+    :return: ary[k]
+    """
+    if high is None:
+        high = len(ary) - 1
+    if not low <= k <= high:
+        raise IndexError(k)
+
+    depth = 2 * (high - low + 1).bit_length()
+    while high - low + 1 > _INSERTION_SORT_SIZE:
+        if depth == 0:
+            _heapsort(ary, low, high)
+            return ary[k]
+        depth -= 1
+
+        _median_of_three(ary, low, high)
+        lt, gt = _partition_three_way(ary, low, high)
+        if k < lt:
+            high = lt - 1
+        elif k > gt:
+            low = gt + 1
+        else:
+            return ary[k]
 
-        # this is the value we will pivot around.  the final pi will be
-        # equal to `low + (the number of values <= pivot)`
-        pivot = ary[high]
+    _insertion_sort(ary, low, high)
+    return ary[k]
 
-        # visit every element of the array starting after the pi
-        # (which is the whole array)
-        for i in range(low, high + 1):
-            # for every element <= pivot, increase pi and swap that value with
-            # ary[pi], filling in the beginning of the array one swap at a time
-            if ary[i] <= pivot:
-                pi += 1
-                ary[i], ary[pi] = ary[pi], ary[i]
 
-        return ary, pi
+def partial_sort(ary, k):
+    """
+    sort the k smallest values of ary in place into ary[:k], leaving the rest unordered,
+    in O(n + k log k)
+    :param ary: a mutable sequence
+    :param k: the number of values to sort
+    :return: ary
+    """
+    k = min(k, len(ary))
+    if k > 0:
+        select(ary, k - 1)
+        introsort(ary, 0, k - 1)
+    return ary
+
+
+def top_k(ary, k, key=None):
+    """
+    the k largest values of ary, largest first, without sorting the rest.  like
+    heapq.nlargest, equal values come out in their original order
+    :param ary: an iterable
+    :param k: the number of values to return
+    :param key: a function of one value returning the value to rank by
+    :return: a new list
+    """
+    if key is None:
+        key = _identity
+
+    # the negated index ranks earlier values higher among equal keys
+    decorated = [(key(value), -i, value) for i, value in enumerate(ary)]
+    k = min(k, len(decorated))
+    if k <= 0:
+        return []
+
+    start = len(decorated) - k
+    select(decorated, start)
+    top = introsort(decorated, start)[start:]
+    top.reverse()
+    return [value for _, _, value in top]
+
+
+def quicksort_buffer(buf):
+    """
+    sort a one dimensional array.array, memoryview or numpy array of numbers in place.
+    with numpy, large partitions are split with vectorized comparisons and small ones are
+    sorted as python values, otherwise the buffer is introsorted item by item.  NaNs are
+    moved to the end, as numpy.sort does
+    :param buf: a writable buffer of numbers
+    :return: buf
+    """
+    if numpy is None:
+        count = _move_nans_last(buf)
+        introsort(buf, 0, count - 1)
+        return buf
+
+    a = buf if isinstance(buf, numpy.ndarray) else numpy.asarray(memoryview(buf))
+    if a.ndim != 1:
+        raise ValueError('expected a one dimensional buffer, not %d dimensions' % a.ndim)
+    if not a.flags.writeable:
+        raise TypeError('cannot sort a read-only buffer')
+
+    if a.dtype.kind == 'f':
+        nans = numpy.isnan(a)
+        count = len(a) - int(numpy.count_nonzero(nans))
+        if count < len(a):
+            a[:count] = a[~nans]
+            a[count:] = numpy.nan
+            a = a[:count]
+
+    stack = [(0, len(a), 2 * len(a).bit_length())]
+    while stack:
+        low, high, depth = stack.pop()
+        part = a[low:high]
+        if len(part) <= _VECTOR_PARTITION_SIZE:
+            part[:] = introsort(part.tolist())
+            continue
+        if depth == 0:
+            _heapsort(part, 0, len(part) - 1)
+            continue
+
+        pivot = sorted((part[0], part[len(part) // 2], part[-1]))[1]
+        less = part < pivot
+        greater = part > pivot
+        lt = int(numpy.count_nonzero(less))
+        gt = len(part) - int(numpy.count_nonzero(greater))
+
+        # the equal values are copied rather than filled from pivot, so -0.0 and 0.0 keep
+        # their sign as they would in the list path
+        part[:lt], part[lt:gt], part[gt:] = part[less], part[~(less | greater)], part[greater]
+        stack.append((low, low + lt, depth - 1))
+        stack.append((low + gt, high, depth - 1))
+
+    return buf
+
+
+def parallel_quicksort(ary, workers=None, serial_cutoff=1 << 16):
+    """
+    sort an array.array in place with a process pool.  the values are copied once into
+    shared memory and the top levels are partitioned here, until every partition is small
+    enough to share out among the workers.  each worker then introsorts its partitions in
+    place in the shared block, so no values are pickled
+    :param ary: an array.array
+    :param workers: the number of worker processes, by default one per cpu
+    :param serial_cutoff: sort arrays no longer than this in-process, and never hand the
+                          pool a partition shorter than this
+    :return: ary
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    n = len(ary)
+    if n <= serial_cutoff or workers < 2:
+        return introsort(ary)
+
+    # about four partitions per worker, so one bad pivot doesn't leave workers idle
+    task_size = max(serial_cutoff, n // (4 * workers))
+    nbytes = n * ary.itemsize
+    block = shared_memory.SharedMemory(create=True, size=nbytes)
+    try:
+        with memoryview(ary).cast('B') as raw:
+            block.buf[:nbytes] = raw
+
+        tasks = []
+        with block.buf[:nbytes] as raw, raw.cast(ary.typecode) as shared:
+            stack = [(0, n - 1, 2 * n.bit_length())]
+            while stack:
+                low, high, depth = stack.pop()
+                if high - low + 1 <= task_size or depth == 0:
+                    # the worker's introsort has its own depth limit for bad ranges
+                    if low < high:
+                        tasks.append((low, high))
+                    continue
+
+                _median_of_three(shared, low, high)
+                lt, gt = _partition_three_way(shared, low, high)
+                stack.append((low, lt - 1, depth - 1))
+                stack.append((gt + 1, high, depth - 1))
+
+        # start the largest partitions first
+        tasks.sort(key=lambda task: task[0] - task[1])
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for future in [pool.submit(_sort_shared, block.name, nbytes, ary.typecode, low, high)
+                           for low, high in tasks]:
+                future.result()
+
+        with memoryview(ary).cast('B') as raw:
+            raw[:] = block.buf[:nbytes]
+    finally:
+        block.close()
+        block.unlink()
+
+    return ary
+
+
+def _sort_shared(name, nbytes, typecode, low, high):
+    # runs in a worker process: attach to the shared block and sort one partition of it
+    block = shared_memory.SharedMemory(name)
+    try:
+        with block.buf[:nbytes] as raw, raw.cast(typecode) as shared:
+            introsort(shared, low, high)
+    finally:
+        block.close()
+
+
+def _move_nans_last(buf):
+    # shift every value that isn't NaN forward over the NaNs, and return how many there are
+    count = 0
+    for i in range(len(buf)):
+        value = buf[i]
+        if value == value:
+            if i != count:
+                buf[count] = value
+            count += 1
+
+    for i in range(count, len(buf)):
+        buf[i] = float('nan')
+    return count
+
+
+def quicksort_traditional(ary, low=0, high=None):
+    if high is None:
+        high = len(ary) - 1
 
     def _quicksort_traditional(ary, low, high):
         # sort if low is still less than high
         # low and high will converge during recursion
         if low < high:
             # partition the array and return the index where the partition occurs
-            ary, pi = _partition(ary, low, high)
+            pi = _partition(ary, low, high)
 
             # sort the low and high partitions
             ary = _quicksort_traditional(ary, low, pi - 1)
@@ -53,3 +427,20 @@ def quicksort_traditional(ary, low=0, high=None):
         return ary
 
     return _quicksort_traditional(ary, low, high)
+
+
+if __name__ == '__main__':
+    # usage: python quicksort.py COUNT [WORKERS], to compare serial and parallel sorting
+    count = int(sys.argv[1])
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 1
+    values = array('d', os.urandom(8 * count))
+    values = array('d', (value for value in values if value == value))
+
+    started = time.perf_counter()
+    introsort(array('d', values))
+    serial = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parallel_quicksort(array('d', values), workers)
+    parallel = time.perf_counter() - started
+    print('serial %.3fs, %d workers %.3fs, speedup %.2fx' % (serial, workers, parallel, serial / parallel))
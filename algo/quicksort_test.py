@@ -1,3 +1,7 @@
+import array
+import heapq
+import math
+import random
 import unittest
 import quicksort
 
@@ -9,6 +13,138 @@ class TestQuicksort(unittest.TestCase):
     def test_quicksort_traditional(self):
         self.assertEqual(quicksort.quicksort_traditional([8, 3, 9, 1, 3, -5, 10]), [-5, 1, 3, 3, 8, 9, 10])
 
+    def test_quicksort_empty(self):
+        self.assertEqual(quicksort.quicksort([]), [])
+        self.assertEqual(quicksort.quicksort_pythonic([]), [])
+
+    def test_introsort(self):
+        rng = random.Random(1)
+        for n in (0, 1, 2, 15, 17, 100, 1000):
+            ary = [rng.randint(-50, 50) for _ in range(n)]
+            self.assertEqual(quicksort.introsort(list(ary)), sorted(ary))
+
+        # sorted, reversed and uniform input would exceed the recursion limit
+        # if recursed through, or take quadratic time with a last element pivot
+        for ary in (list(range(20000)), list(range(20000, 0, -1)), [7] * 20000):
+            self.assertEqual(quicksort.quicksort(ary), sorted(ary))
+
+        ary = [5, 4, 3, 2, 1, 0]
+        self.assertIs(quicksort.introsort(ary, 1, 4), ary)
+        self.assertEqual(ary, [5, 1, 2, 3, 4, 0])
+
+    def test_three_way(self):
+        rng = random.Random(2)
+        ary = [rng.randint(0, 3) for _ in range(5000)]
+        self.assertEqual(quicksort.quicksort(ary, three_way=True), sorted(ary))
+        self.assertEqual(quicksort.quicksort([], three_way=True), [])
+
+        ary = [3, 1, 2, 3, 3, 0, 3]
+        lt, gt = quicksort._partition_three_way(ary, 0, 6)
+        self.assertEqual((lt, gt), (3, 6))
+        self.assertEqual(sorted(ary[:lt]), [0, 1, 2])
+        self.assertEqual(ary[lt:], [3, 3, 3, 3])
+
+    def test_key_reverse(self):
+        records = [('b', 2), ('a', 1), ('c', 2), ('d', 0), ('e', 1)]
+        field = lambda record: record[1]
+        for reverse in (False, True):
+            self.assertEqual(quicksort.quicksort(records, key=field, reverse=reverse),
+                             sorted(records, key=field, reverse=reverse))
+        self.assertEqual(quicksort.quicksort([3, 1, 2], reverse=True), [3, 2, 1])
+
+        # each key is computed once, and values themselves are never compared
+        calls = []
+        values = [object() for _ in range(50)]
+        result = quicksort.quicksort(values, key=lambda v: calls.append(v) or id(v) % 7)
+        self.assertEqual(len(calls), 50)
+        self.assertEqual(result, sorted(values, key=lambda v: id(v) % 7))
+
+    def test_select(self):
+        rng = random.Random(3)
+        for n in (1, 10, 100, 2000):
+            ary = [rng.randint(0, n // 3) for _ in range(n)]
+            expected = sorted(ary)
+            for k in (0, n // 2, n - 1):
+                work = list(ary)
+                self.assertEqual(quicksort.select(work, k), expected[k])
+                self.assertTrue(all(v <= work[k] for v in work[:k]))
+                self.assertTrue(all(v >= work[k] for v in work[k + 1:]))
+
+        with self.assertRaises(IndexError):
+            quicksort.select([1, 2], 2)
+
+    def test_partial_sort(self):
+        rng = random.Random(4)
+        ary = [rng.random() for _ in range(1000)]
+        expected = sorted(ary)
+        work = list(ary)
+        self.assertIs(quicksort.partial_sort(work, 10), work)
+        self.assertEqual(work[:10], expected[:10])
+        self.assertEqual(sorted(work), expected)
+        self.assertEqual(quicksort.partial_sort([2, 1], 5), [1, 2])
+
+    def test_top_k(self):
+        rng = random.Random(5)
+        records = [(i, rng.randint(0, 20)) for i in range(500)]
+        field = lambda record: record[1]
+        for k in (0, 1, 10, 500, 600):
+            self.assertEqual(quicksort.top_k(records, k, key=field),
+                             heapq.nlargest(k, records, key=field))
+        self.assertEqual(quicksort.top_k(iter([5, 1, 4]), 2), [5, 4])
+
+    def test_quicksort_buffer(self):
+        rng = random.Random(6)
+        values = [rng.uniform(-1e6, 1e6) for _ in range(5000)] + [0.0, -0.0] * 10
+        for buf in (array.array('d', values), memoryview(array.array('d', values))):
+            self.assertIs(quicksort.quicksort_buffer(buf), buf)
+            self.assertEqual(list(buf), quicksort.quicksort(values))
+
+        ints = array.array('i', [rng.randint(-5, 5) for _ in range(3000)])
+        expected = sorted(ints)
+        quicksort.quicksort_buffer(ints)
+        self.assertEqual(ints.tolist(), expected)
+
+        nan = float('nan')
+        buf = array.array('d', [3.0, nan, 1.0, nan, 2.0])
+        quicksort.quicksort_buffer(buf)
+        self.assertEqual(buf.tolist()[:3], [1.0, 2.0, 3.0])
+        self.assertTrue(all(math.isnan(value) for value in buf[3:]))
+
+    @unittest.skipIf(quicksort.numpy is None, 'numpy is not installed')
+    def test_quicksort_buffer_numpy(self):
+        numpy = quicksort.numpy
+        rng = numpy.random.default_rng(7)
+        for a in (rng.standard_normal(20000), rng.integers(0, 10, 20000), numpy.arange(20000.0)):
+            expected = numpy.sort(a)
+            self.assertIs(quicksort.quicksort_buffer(a), a)
+            numpy.testing.assert_array_equal(a, expected)
+
+        a = rng.standard_normal(2000)
+        a[::7] = numpy.nan
+        expected = numpy.sort(a)
+        quicksort.quicksort_buffer(a)
+        numpy.testing.assert_array_equal(a, expected)
+
+        with self.assertRaises(ValueError):
+            quicksort.quicksort_buffer(numpy.zeros((2, 2)))
+
+    def test_parallel_quicksort(self):
+        rng = random.Random(8)
+        for typecode, values in (('d', [rng.random() for _ in range(5000)]),
+                                 ('q', [rng.randint(0, 50) for _ in range(5000)])):
+            ary = array.array(typecode, values)
+            self.assertIs(quicksort.parallel_quicksort(ary, workers=2, serial_cutoff=100), ary)
+            self.assertEqual(ary.tolist(), sorted(values))
+
+        # below the cutoff no pool is started
+        ary = array.array('i', [3, 1, 2])
+        self.assertEqual(quicksort.parallel_quicksort(ary, workers=2).tolist(), [1, 2, 3])
+
+    def test_heapsort(self):
+        ary = [9, 8, 3, 1, 7, 2, 5, 0]
+        quicksort._heapsort(ary, 1, 6)
+        self.assertEqual(ary, [9, 1, 2, 3, 5, 7, 8, 0])
+
 
 if __name__ == '__main__':
     unittest.main()
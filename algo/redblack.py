@@ -22,17 +22,16 @@ class InvalidInsertNodeError(Exception):
 
 
 def _find_closest_ancestor_by_key(node, key):
-    # have we found an exact match?
-    if key == node.key:
-        return node
+    # stop when we have found an exact match
+    while key != node.key:
+        # go right if the search key is greater than this node's key, otherwise left
+        child = node.right if key > node.key else node.left
 
-    # go right if the search key is greater than this node's key, otherwise left
-    if key > node.key and node.right is not None:
-        return _find_closest_ancestor_by_key(node.right, key)
-    elif node.left is not None:
-        return _find_closest_ancestor_by_key(node.left, key)
+        # we hit a dead end, so this is close enough
+        if child is None:
+            return node
+        node = child
 
-    # we hit a dead end, so this is close enough
     return node
 
 
@@ -66,35 +65,6 @@ def _get_node_color(node):
     return node.color
 
 
-def _flip_color(node):
-    if node is None:
-        raise NullNodeError()
-
-    if node.color == BLACK:
-        node.color = RED
-    else:
-        node.color = BLACK
-
-
-def _red_uncle_recolor(node):
-    # flip our color and our sibling
-    _flip_color(node)
-    sibling = _find_sibling(node)
-    if sibling is not None:
-        _flip_color(sibling)
-
-    # change parent color if parent exists and parent and child are both red
-    # if not, then we are done
-    if node.parent is not None and _get_node_color(node) == RED and _get_node_color(node.parent) == RED:
-        _flip_color(node.parent)
-    else:
-        return
-
-    # check if our uncle is red, if so, repeat this process
-    if _get_node_color(_find_sibling(node.parent)) == RED:
-        _red_uncle_recolor(node.parent)
-
-
 def _left_rotation(node):
     #     parent            parent
     #       /  \    =>      /  \
@@ -189,83 +159,130 @@ def _copy_node(src, dest):
     dest.content = src.content
 
 
-def _rebalance_double_black(node):
-    # rebalancing is required when a leaf node is deleted that is not the root
-    if node.parent is not None:
-        sibling = _find_sibling(node)
-        if _get_node_color(sibling) == BLACK:
-            # Case 1a - sibling is black and one at least one child is red
-            if _get_node_color(sibling.left) == RED or _get_node_color(sibling.right) == RED:
-                raise Exception("Unimplimented")
-
-            # Case1b - sibling is black and both children are black
-            else:
-                raise Exception("Unimplimented")
-
-        # Case 1c - sibling is red
-        else:
-            raise Exception("Unimplimented")
-
+def _rebalance_double_black(node, parent):
+    # node (which may be None) is one black short on every path through it, after a black
+    # node was removed above it.  fix that by borrowing from its sibling, or by pushing the
+    # shortage up a level and trying again
+    while parent is not None and _get_node_color(node) == BLACK:
+        if node is parent.left:
+            sibling = parent.right
+
+            # Case 1 - sibling is red: rotate so that node has a black sibling instead
+            if sibling.color == RED:
+                sibling.color = BLACK
+                parent.color = RED
+                _left_rotation(parent)
+                sibling = parent.right
+
+            # Case 2 - sibling and both its children are black: take a black off both
+            # sides, which makes parent the one that is short
+            if _get_node_color(sibling.left) == BLACK and _get_node_color(sibling.right) == BLACK:
+                sibling.color = RED
+                node, parent = parent, parent.parent
+                continue
+
+            # Case 3 - sibling's far child is black: rotate the red near child into its place
+            if _get_node_color(sibling.right) == BLACK:
+                sibling.left.color = BLACK
+                sibling.color = RED
+                _right_rotation(sibling)
+                sibling = parent.right
+
+            # Case 4 - sibling's far child is red: rotate the sibling up, which adds
+            # a black above node, and we are done
+            sibling.color = parent.color
+            parent.color = BLACK
+            sibling.right.color = BLACK
+            _left_rotation(parent)
+            return
 
-def _replace_parent_with_child(child, parent):
-    # if the two merging nodes are different colors, make the new node black
-    # merge, and delete the old child
-    if _get_node_color(parent) != _get_node_color(child):
+        # the mirror image of the above
+        sibling = parent.left
+        if sibling.color == RED:
+            sibling.color = BLACK
+            parent.color = RED
+            _right_rotation(parent)
+            sibling = parent.left
+
+        if _get_node_color(sibling.left) == BLACK and _get_node_color(sibling.right) == BLACK:
+            sibling.color = RED
+            node, parent = parent, parent.parent
+            continue
+
+        if _get_node_color(sibling.left) == BLACK:
+            sibling.right.color = BLACK
+            sibling.color = RED
+            _left_rotation(sibling)
+            sibling = parent.left
+
+        sibling.color = parent.color
         parent.color = BLACK
-        _copy_node(child, parent)
-        _delete_node(child)
+        sibling.left.color = BLACK
+        _right_rotation(parent)
+        return
 
-    # the nodes are both BLACK, and must be rebalanced
-    else:
-        raise("Unimplimented")
+    # a red node absorbs the extra black, and at the root it is simply dropped
+    if node is not None:
+        node.color = BLACK
 
 
 def _delete_node(node):
+    """
+    unlink node from its tree and rebalance, iteratively
+    :param node: the node to delete
+    :return: a node still in the tree, from which its root can be found, or None if the
+             tree is now empty
+    """
     # non-existant nodes can't be deleted!
     if node is None:
         raise NullNodeError()
 
+    # a node with two children takes its in-order sucessor's content, and the
+    # sucessor, which has no left child, is deleted instead
+    if node.left is not None and node.right is not None:
+        sucessor = node.right
+        while sucessor.left is not None:
+            sucessor = sucessor.left
+        _copy_node(sucessor, node)
+        node = sucessor
+
+    # node now has at most one child, which takes its place
+    child = node.left if node.left is not None else node.right
     parent = node.parent
+    if child is not None:
+        child.parent = parent
+    if parent is None:
+        if child is not None:
+            child.color = BLACK
+        return child
+
+    if parent.left is node:
+        parent.left = child
+    else:
+        parent.right = child
+    node.parent = node.left = node.right = None
 
-    # Case 1 - leaf node
-    if node.left is None and node.right is None:
-        # deleting a leaf node causes a double-black condition
-        # and needs rebalancing
-        _rebalance_double_black(node)
-
-        # remove the node
-        if node.parent is not None:
-            node.parent = None
-            del node
-
-    # left child exists
-    elif node.left is not None:
+    # removing a red node changes no black counts, and a red child can
+    # simply turn black to replace the black node that was removed
+    if node.color == BLACK:
+        if _get_node_color(child) == RED:
+            child.color = BLACK
+        else:
+            _rebalance_double_black(child, parent)
 
-        # Case 2a - left is an only child.
-        if node.right is None:
-            _replace_parent_with_child(node.left, node)
+    return parent
 
-        # Case 3 - node has two children
-        else:
-            # find in-order sucessor of this node
-            sucessor = node.right
-            while sucessor.left is not None:
-                sucessor = sucessor.left
-
-            # if the in-order sucessor is also a child, use the defined process for that
-            if sucessor == node.right:
-                _replace_parent_with_child(sucessor, node)
-
-            # copy the sucessor into node, and delete sucessor
-            # (where sucessor is not a child of node)
-            # (sucessor is also always a leaf or has only a right child)
-            else:
-                _copy_node(sucessor, node)
-                _delete_node(sucessor)
 
-    # Case 2b - right is an only child
-    else:
-        _replace_parent_with_child(node.right, node)
+def _black_height(node):
+    # the number of black nodes on every path from node down to a leaf,
+    # or -1 if the paths disagree
+    if node is None:
+        return 0
+    left = _black_height(node.left)
+    right = _black_height(node.right)
+    if left < 0 or left != right:
+        return -1
+    return left + (1 if node.color == BLACK else 0)
 
 
 def _validate_redblack_tree(node):
@@ -278,14 +295,23 @@ def _validate_redblack_tree(node):
     if node is None:
         return True
 
-    # any combination is ok as long as a red parent does not have any red children
-    if _get_node_color(node) == RED and (
-            _get_node_color(node.left) == RED or
-            _get_node_color(node.right) == RED):
+    # every path down must pass through the same number of black nodes
+    if _black_height(node) < 0:
         return False
 
-    # return true only if all children are valid
-    return _validate_redblack_tree(node.left) and _validate_redblack_tree(node.right)
+    # any combination is ok as long as a red parent does not have any red children
+    # and every child points back to its parent
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        for child in (node.left, node.right):
+            if child is None:
+                continue
+            if child.parent is not node or (node.color == RED and child.color == RED):
+                return False
+            stack.append(child)
+
+    return True
 
 
 class RedBlackTree:
@@ -300,64 +326,62 @@ class RedBlackTree:
             return
 
         parent = _find_closest_ancestor_by_key(self.__root, key)
-        inserted = _insert_at_node(parent, key, content)
+        node = _insert_at_node(parent, key, content)
+
+        # walk up while a red node has a red parent.  the parent can't be the
+        # root, since the root is always black, so the grandparent exists
+        while _get_node_color(node.parent) == RED:
+            parent = node.parent
+            grandparent = parent.parent
+            uncle = _find_sibling(parent)
+
+            # red uncle - push the grandparent's black down a level, and
+            # check the grandparent against its own parent
+            if _get_node_color(uncle) == RED:
+                parent.color = BLACK
+                uncle.color = BLACK
+                grandparent.color = RED
+                node = grandparent
+                continue
+
+            # black uncle - rotate the middle of the three keys up above the other two
+            if grandparent.left is parent:
+                # Case 2 - left right, which rotates into Case 1
+                if parent.right is node:
+                    _left_rotation(parent)
+                    parent = node
+
+                # Case 1 - left left
+                _right_rotation(grandparent)
 
-        # if our parent is black, then no change is needed
-        if _get_node_color(parent) == BLACK:
-            return
+            else:
+                # Case 4 - right left, which rotates into Case 3
+                if parent.left is node:
+                    _right_rotation(parent)
+                    parent = node
 
-        if _get_node_color(_find_sibling(parent)) == RED:
-            _red_uncle_recolor(parent)
+                # Case 3 - right right
+                _left_rotation(grandparent)
 
-        else:
-            # determine this node and parent's position within their parents
-            parent_left_of_grand = True
-            if inserted.parent.parent.left != inserted.parent:
-                parent_left_of_grand = False
-
-            inserted_left_of_parent = True
-            if inserted.parent.left != inserted:
-                inserted_left_of_parent = False
-
-            # Case 1 - left left
-            if parent_left_of_grand and inserted_left_of_parent:
-                _flip_color(inserted.parent.parent)
-                _flip_color(inserted.parent)
-                _right_rotation(inserted.parent.parent)
-
-            # Case 2 - left right
-            elif parent_left_of_grand and not inserted_left_of_parent:
-                _flip_color(inserted.parent.parent)
-                _flip_color(inserted)
-                _left_rotation(inserted.parent)
-                _right_rotation(inserted.parent)
-
-            # Case 3 - right right
-            elif not parent_left_of_grand and not inserted_left_of_parent:
-                _flip_color(inserted.parent.parent)
-                _flip_color(inserted.parent)
-                _left_rotation(inserted.parent.parent)
-
-            # Case 4 - right left
-            elif not parent_left_of_grand and inserted_left_of_parent:
-                _flip_color(inserted.parent.parent)
-                _flip_color(inserted)
-                _right_rotation(inserted.parent)
-                _left_rotation(inserted.parent)
-
-            # verify or update self.__root to be the greatest ancestor if it
-            # is not already so, since we had to re-organize
-            while self.__root.parent is not None:
-                self.__root = self.__root.parent
+            parent.color = BLACK
+            grandparent.color = RED
+            break
+
+        # verify or update self.__root to be the greatest ancestor if it
+        # is not already so, since we had to re-organize
+        while self.__root.parent is not None:
+            self.__root = self.__root.parent
+        self.__root.color = BLACK
 
     def delete(self, key):
+        # raises KeyError if the node cannot be found, since it cannot be deleted!
         node = _find_node_by_key(self.__root, key)
 
-        # if the node cannot be found, it cannot be deleted!
-        if node is None:
-            return KeyError()
-
-        _delete_node(node)
+        # rotations may have moved the root, so find it again from a node that remains
+        root = _delete_node(node)
+        while root is not None and root.parent is not None:
+            root = root.parent
+        self.__root = root
 
     def get_content(self, key):
         found = _find_node_by_key(self.__root, key)
@@ -386,17 +410,41 @@ class RedBlackTree:
 
 
 if __name__ == '__main__':
-    import pprint
+    # usage: python redblack.py [OPERATIONS [SIZE]], a churn benchmark that deletes a random
+    # key and inserts a new one per pair of operations, on a tree holding SIZE keys
+    import random
+    import sys
+    import time
 
-    tree = RedBlackTree()
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    size = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    rng = random.Random(0)
 
-    tree.insert(100, 'a')
-    tree.insert(200, 'b')
-    tree.insert(300, 'c')
-    tree.insert(500, 'e')
-    tree.insert(700, 'f')
-    tree.insert(800, 'g')
-    tree.insert(900, 'h')
-    pprint.pprint(tree._describe())
-    tree.delete(500)
-    pprint.pprint(tree._describe())
+    tree = RedBlackTree()
+    keys = rng.sample(range(4 * size), size)
+    for key in keys:
+        tree.insert(key)
+
+    # report the mean latency of every tenth of the run, which stays flat while the
+    # tree keeps its logarithmic height
+    block = max(2, operations // 10)
+    started = time.perf_counter()
+    for done in range(0, operations, 2):
+        i = rng.randrange(size)
+        tree.delete(keys[i])
+        key = rng.randrange(4 * size)
+        while True:
+            try:
+                tree.get_content(key)
+            except KeyError:
+                break
+            key = rng.randrange(4 * size)
+        tree.insert(key)
+        keys[i] = key
+
+        if (done + 2) % block < 2:
+            now = time.perf_counter()
+            print('%10d ops  %.2f us/op' % (done + 2, 1e6 * (now - started) / block))
+            started = now
+
+    print('valid' if tree._validate() else 'INVALID')
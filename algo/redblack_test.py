@@ -1,3 +1,4 @@
+import random
 import unittest
 import redblack
 
@@ -55,11 +56,6 @@ class TestRedBlack(unittest.TestCase):
         self.assertEqual(redblack._get_node_color(tree.left.right),
                          redblack.BLACK)
 
-    def test_flip_color(self):
-        node = redblack.RedBlackNode(1)
-        redblack._flip_color(node)
-        self.assertEqual(node.color, redblack.BLACK)
-
     def test_left_rotation(self):
         tree = _create_tree()
         redblack._left_rotation(tree.left)
@@ -105,14 +101,6 @@ class TestRedBlack(unittest.TestCase):
                           None,
                           700)  # no tree provided
 
-    def test_red_uncle_recolor(self):
-        tree = _create_tree()
-        tree.right.right.color = redblack.RED
-        redblack._red_uncle_recolor(tree.right)
-        self.assertEqual(tree.color, redblack.BLACK)
-        self.assertEqual(tree.left.color, redblack.BLACK)
-        self.assertEqual(tree.right.color, redblack.BLACK)
-
     def test_describe(self):
         tree = _insert_tree()
         result = tree._describe()
@@ -136,6 +124,55 @@ class TestRedBlack(unittest.TestCase):
         self.assertEqual(tree.right.right.content, tree.right.content)
         self.assertNotEqual(tree.right.right.parent, tree.right.parent)
 
+    def test_validate_black_height(self):
+        tree = _create_tree()
+        tree.left.left.color = redblack.RED
+        self.assertFalse(redblack._validate_redblack_tree(tree))
+
+    def test_delete(self):
+        tree = _insert_tree()
+        tree.delete(500)
+        self.assertTrue(tree._validate())
+        self.assertRaises(KeyError, tree.get_content, 500)
+        self.assertEqual(tree.get_content(700), 'f')
+        self.assertRaises(KeyError, tree.delete, 500)
+
+        for key in (100, 200, 300, 700, 800, 900):
+            tree.delete(key)
+            self.assertTrue(tree._validate())
+        self.assertEqual(tree._describe(), None)
+
+        tree.insert(1, 'x')
+        self.assertEqual(tree.get_content(1), 'x')
+
+    def test_churn(self):
+        rng = random.Random(1)
+        tree = redblack.RedBlackTree()
+        present = {}
+        for i in range(3000):
+            if present and rng.random() < 0.45:
+                key = rng.choice(list(present))
+                tree.delete(key)
+                del present[key]
+            else:
+                key = rng.randrange(100000)
+                if key in present:
+                    continue
+                tree.insert(key, i)
+                present[key] = i
+
+            if i % 100 == 0:
+                self.assertTrue(tree._validate())
+
+        self.assertTrue(tree._validate())
+        for key, content in present.items():
+            self.assertEqual(tree.get_content(key), content)
+
+        # a valid tree of n keys is at most 2 * log2(n + 1) deep
+        def depth(node):
+            return 0 if node is None else 1 + max(depth(node['left']), depth(node['right']))
+        self.assertLessEqual(depth(tree._describe()), 2 * (len(present) + 1).bit_length())
+
 
 if __name__ == '__main__':
     unittest.main()